@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+
+from mongodb_odm import ODMObjectId
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from app.config import (
+    DOMAIN_CHECK_CACHE_SIZE,
+    PROJECT_CACHE_INVALIDATION,
+    PROJECT_CACHE_SIZE,
+    PROJECT_CACHE_TTL,
+)
+from app.models import CacheInvalidation, Project
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_COLLECTION_SIZE = 1024 * 1024  # 1 MB capped collection
+INVALIDATION_RETRY_SECONDS = 1
+
+# Unique per process, every uvicorn worker imports this module separately.
+WORKER_ID = uuid.uuid4().hex
+
+
+class LRUCache[T]:
+    """
+    Bounded LRU cache, thread safe since sync endpoints run in the threadpool.
+
+    Entries are trusted for ttl seconds so a missed invalidation can't serve
+    stale data forever.
+    """
+
+    def __init__(self, max_size: int, ttl: int) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items: OrderedDict[str, tuple[float, T]] = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every write so a slow database read can't overwrite a newer entry.
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: str) -> T | None:
+        if self.max_size <= 0:
+            return None
+
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+
+            cached_at, value = item
+            if time.monotonic() - cached_at > self.ttl:
+                del self._items[key]
+                return None
+
+            self._items.move_to_end(key)
+
+        return value
+
+    def set(self, key: str, value: T) -> None:
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._version += 1
+            self._store(key, value)
+
+    def fill(self, key: str, value: T, version: int) -> None:
+        """Store a value read before `version`, unless the cache was written or invalidated since"""
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            if self._version == version:
+                self._store(key, value)
+
+    def _store(self, key: str, value: T) -> None:
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._version += 1
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._version += 1
+            self._items.clear()
+
+
+class ProjectCache(LRUCache[Project]):
+    """
+    Projects keyed by project id.
+
+    Callers get a copy, never the cached object itself,
+    so mutating a project before saving it doesn't leak into the cache.
+    """
+
+    def get(self, project_id: str) -> Project | None:
+        project = super().get(project_id)
+        if project is None:
+            return None
+        return project.model_copy()
+
+    def set(self, project_id: str, project: Project) -> None:
+        super().set(project_id, project.model_copy())
+
+    def fill(self, project_id: str, project: Project, version: int) -> None:
+        super().fill(project_id, project.model_copy(), version)
+
+    def add(self, project: Project) -> None:
+        self.set(str(project.id), project)
+
+    def fill_project(self, project: Project, version: int) -> None:
+        self.fill(str(project.id), project, version)
+
+
+project_cache = ProjectCache(PROJECT_CACHE_SIZE, PROJECT_CACHE_TTL)
+# Hosts allowed by the domain check. Only positive answers are kept
+# and the whole cache is dropped on any project write.
+domain_cache = LRUCache[bool](DOMAIN_CHECK_CACHE_SIZE, PROJECT_CACHE_TTL)
+
+# Called after a full flush, e.g. to prewarm the caches again.
+flush_hooks: list[Callable[[], None]] = []
+
+
+def publish_invalidation(project_id: str) -> None:
+    """Tell the other workers to drop their cached copy of a project"""
+    publish_invalidations([project_id])
+
+
+def publish_invalidations(project_ids: list[str]) -> None:
+    """Same as `publish_invalidation` for many projects, with a single insert"""
+    if PROJECT_CACHE_INVALIDATION is False or not project_ids:
+        return
+
+    try:
+        CacheInvalidation._get_collection().insert_many(
+            [CacheInvalidation(project_id=project_id, worker_id=WORKER_ID).to_mongo() for project_id in project_ids]
+        )
+    except PyMongoError:
+        logger.exception("Failed to publish cache invalidation for %s project(s)", len(project_ids))
+
+
+def cache_project(project: Project) -> None:
+    """Store the freshly written project and invalidate it on other workers"""
+    cache_projects([project])
+
+
+def cache_projects(projects: list[Project]) -> None:
+    """Same as `cache_project` for many projects, the domain cache is cleared and the other workers told once"""
+    for project in projects:
+        project_cache.add(project)
+    domain_cache.clear()
+    publish_invalidations([str(project.id) for project in projects])
+
+
+def evict_project(project_id: str) -> None:
+    """Remove a project from the cache on this and other workers"""
+    project_cache.invalidate(project_id)
+    domain_cache.clear()
+    publish_invalidation(project_id)
+
+
+def flush_caches() -> None:
+    """Drop every cached entry of this worker and run the flush hooks"""
+    project_cache.clear()
+    domain_cache.clear()
+
+    for hook in flush_hooks:
+        try:
+            hook()
+        except Exception:
+            logger.exception("Cache flush hook failed")
+
+
+class InvalidationListener:
+    """
+    Follow the capped invalidation collection with a tailable cursor
+    and evict projects written by other workers.
+    """
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._collection_ready = False
+
+    def start(self) -> None:
+        # Created before any write can publish, or by the thread once the database is reachable.
+        try:
+            ensure_invalidation_collection()
+            self._collection_ready = True
+        except PyMongoError:
+            logger.exception("Failed to create the cache invalidation collection, retrying in the background")
+            self._collection_ready = False
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="project-cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=INVALIDATION_RETRY_SECONDS * 2)
+            self._thread = None
+
+    def _run(self) -> None:
+        # Only messages published after this worker started are relevant.
+        last_id = ODMObjectId()
+
+        while not self._stop.is_set():
+            try:
+                if not self._collection_ready:
+                    ensure_invalidation_collection()
+                    self._collection_ready = True
+
+                cursor = CacheInvalidation.find_raw(
+                    {"_id": {"$gt": last_id}},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                ).max_await_time_ms(INVALIDATION_RETRY_SECONDS * 1000)
+
+                while cursor.alive and not self._stop.is_set():
+                    for data in cursor:
+                        last_id = data["_id"]
+                        if data.get("worker_id") != WORKER_ID:
+                            project_cache.invalidate(data["project_id"])
+                            domain_cache.clear()
+            except PyMongoError:
+                logger.exception("Cache invalidation listener failed, retrying")
+                flush_caches()
+
+            self._stop.wait(INVALIDATION_RETRY_SECONDS)
+
+
+def ensure_invalidation_collection() -> None:
+    database = CacheInvalidation._get_collection().database
+    try:
+        database.create_collection(
+            CacheInvalidation._get_collection_name(),
+            capped=True,
+            size=INVALIDATION_COLLECTION_SIZE,
+        )
+    except CollectionInvalid:
+        pass  # Already exists
+
+
+invalidation_listener = InvalidationListener()
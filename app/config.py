@@ -10,8 +10,57 @@ DB_URL = str(os.environ.get("DB_URL"))
 
 ALLOWED_HOSTS = os.environ.get("ALLOWED_HOSTS", "*")
 SITE_DOMAIN = str(os.environ.get("SITE_DOMAIN"))
+# Comma separated list of every base domain served through wildcard subdomains.
+SITE_DOMAINS = [domain.strip() for domain in os.environ.get("SITE_DOMAINS", SITE_DOMAIN).split(",") if domain.strip()]
+# Number of labels allowed in front of a base domain, e.g. 2 allows "www.abc.example.com".
+SUBDOMAIN_MAX_DEPTH = int(os.environ.get("SUBDOMAIN_MAX_DEPTH", 1))
+
+# Number of projects kept in the per-worker read cache, 0 disables the cache.
+PROJECT_CACHE_SIZE = int(os.environ.get("PROJECT_CACHE_SIZE", 1024))
+# Seconds a cached project is trusted before it's read again from the database.
+PROJECT_CACHE_TTL = int(os.environ.get("PROJECT_CACHE_TTL", 60))
+# Broadcast cache invalidation to other workers through a capped collection.
+PROJECT_CACHE_INVALIDATION = bool(os.environ.get("PROJECT_CACHE_INVALIDATION", False))
+# Number of hosts allowed by the domain check kept per worker, 0 disables it.
+# Off by default without invalidation, a removed domain would stay allowed on other workers.
+DOMAIN_CHECK_CACHE_SIZE = int(os.environ.get("DOMAIN_CHECK_CACHE_SIZE", 4096 if PROJECT_CACHE_INVALIDATION else 0))
+
+# Counters kept to track the hottest hosts and projects, 0 disables the tracking.
+HOT_KEYS_SIZE = int(os.environ.get("HOT_KEYS_SIZE", 512))
+# Number of the hottest keys persisted and used to prewarm the caches.
+HOT_KEYS_TOP = int(os.environ.get("HOT_KEYS_TOP", 100))
+# Seconds between two snapshots of the hottest keys of a worker.
+HOT_KEYS_PERSIST_INTERVAL = int(os.environ.get("HOT_KEYS_PERSIST_INTERVAL", 300))
+
+# Read preference for read-only endpoints:
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest. Writes always use the primary.
+DOMAIN_CHECK_READ_PREFERENCE = os.environ.get("DOMAIN_CHECK_READ_PREFERENCE", "primary")
+PROJECT_READ_PREFERENCE = os.environ.get("PROJECT_READ_PREFERENCE", "primary")
+# Maximum replication lag of a secondary to read from, MongoDB requires at least 90, -1 disables the limit.
+READ_MAX_STALENESS_SECONDS = int(os.environ.get("READ_MAX_STALENESS_SECONDS", -1))
+
+# Number of physical project collections, tenants are spread by a hash of their subdomain.
+# Changing it requires `scripts/partition_projects.py` to move the existing projects.
+PROJECT_PARTITIONS = int(os.environ.get("PROJECT_PARTITIONS", 1))
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
-LOG_LEVEL = "INFO" if DEBUG is True else "INFO"
+# Requests with the "X-Profile" header set to this secret are profiled, unset disables profiling.
+PROFILING_SECRET = os.environ.get("PROFILING_SECRET")
+# Fraction of the requests with a valid secret that are actually profiled.
+PROFILING_SAMPLE_RATE = float(os.environ.get("PROFILING_SAMPLE_RATE", 1.0))
+# Default profiler, "deterministic" (cProfile/pstats) or "sampling" (collapsed stacks).
+PROFILING_MODE = os.environ.get("PROFILING_MODE", "deterministic")
+PROFILING_SAMPLE_INTERVAL = float(os.environ.get("PROFILING_SAMPLE_INTERVAL", 0.001))
+PROFILING_DIR = os.environ.get("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+# Profiles kept in PROFILING_DIR, the oldest are removed first, 0 keeps every profile.
+PROFILING_MAX_FILES = int(os.environ.get("PROFILING_MAX_FILES", 100))
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG" if DEBUG is True else "INFO").upper()
+# Per-logger levels, e.g. "app.routers=WARNING,pymongo=WARNING".
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+# Fraction of the records below WARNING kept per logger, e.g. "app.routers=0.01".
+LOG_SAMPLING = os.environ.get("LOG_SAMPLING", "")
+# Records waiting for the background writer, new records are dropped when it's full.
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
@@ -0,0 +1,237 @@
+import base64
+import hashlib
+import hmac
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+import bson
+from pymongo.client_session import ClientSession
+from pymongo.read_preferences import (
+    Nearest,
+    Primary,
+    PrimaryPreferred,
+    Secondary,
+    SecondaryPreferred,
+    _ServerMode,
+)
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import DOMAIN_CHECK_READ_PREFERENCE, PROJECT_READ_PREFERENCE, READ_MAX_STALENESS_SECONDS, SECRET_KEY
+from app.models import Project
+from app.partitions import use_partition
+
+CAUSAL_TOKEN_HEADER = "X-Causal-Token"
+
+_read_preference_modes = {
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+
+def get_read_preference(mode: str, max_staleness: int = -1) -> _ServerMode:
+    """
+    Build a pymongo read preference from its name.
+    MongoDB requires max_staleness to be at least 90 seconds, -1 means no limit.
+    """
+    if max_staleness != -1 and max_staleness < 90:
+        raise ValueError(f"Invalid max staleness {max_staleness}, it must be -1 or at least 90 seconds")
+
+    mode = mode.strip().lower()
+    if mode == "primary":
+        return Primary()
+
+    if mode not in _read_preference_modes:
+        raise ValueError(f"Invalid read preference '{mode}'")
+
+    return _read_preference_modes[mode](max_staleness=max_staleness)
+
+
+class CausalClock:
+    """
+    Keep the latest cluster and operation time of writes.
+
+    Reads routed to a secondary start from this clock so the secondary waits
+    until it has replicated our own writes (read-your-writes) before answering.
+    One clock follows the writes of this worker, another one the writes of the client
+    of the request, carried between workers by the "X-Causal-Token" header.
+    """
+
+    def __init__(self) -> None:
+        self.cluster_time: Any = None
+        self.operation_time: Any = None
+        self._lock = threading.Lock()
+
+    def advance(self, session: ClientSession) -> None:
+        with self._lock:
+            if session.cluster_time is not None:
+                if self.cluster_time is None or session.cluster_time["clusterTime"] > self.cluster_time["clusterTime"]:
+                    self.cluster_time = session.cluster_time
+            if session.operation_time is not None:
+                if self.operation_time is None or session.operation_time > self.operation_time:
+                    self.operation_time = session.operation_time
+
+    def apply(self, session: ClientSession) -> None:
+        with self._lock:
+            cluster_time, operation_time = self.cluster_time, self.operation_time
+
+        if cluster_time is not None:
+            session.advance_cluster_time(cluster_time)
+        if operation_time is not None:
+            session.advance_operation_time(operation_time)
+
+    def to_token(self) -> str | None:
+        """Signed token of the clock, so clients can't make reads wait for a forged time"""
+        with self._lock:
+            if self.cluster_time is None or self.operation_time is None:
+                return None
+            payload = bson.encode({"cluster_time": self.cluster_time, "operation_time": self.operation_time})
+
+        data = base64.urlsafe_b64encode(payload).decode("ascii")
+        return f"{data}.{sign_causal_token(data)}"
+
+    @classmethod
+    def from_token(cls, token: str | None) -> "CausalClock":
+        """Clock of the token, an empty one when it's missing or invalid"""
+        clock = cls()
+        if not token:
+            return clock
+
+        data, _, signature = token.partition(".")
+        if not hmac.compare_digest(signature.encode("latin-1"), sign_causal_token(data).encode()):
+            return clock
+
+        try:
+            payload = bson.decode(base64.urlsafe_b64decode(data))
+        except (ValueError, bson.errors.BSONError):
+            return clock
+
+        clock.cluster_time = payload.get("cluster_time")
+        clock.operation_time = payload.get("operation_time")
+        return clock
+
+
+def sign_causal_token(data: str) -> str:
+    return hmac.new(SECRET_KEY.encode(), data.encode(), hashlib.sha256).hexdigest()
+
+
+causal_clock = CausalClock()
+# Writes and token of the current request, set by CausalTokenMiddleware.
+request_causal_clock: ContextVar[CausalClock | None] = ContextVar("request_causal_clock", default=None)
+
+domain_check_read_preference = get_read_preference(DOMAIN_CHECK_READ_PREFERENCE, READ_MAX_STALENESS_SECONDS)
+project_read_preference = get_read_preference(PROJECT_READ_PREFERENCE, READ_MAX_STALENESS_SECONDS)
+
+# Possibly stale secondary reads never fill a cache, domain checks are only cached from the primary.
+domain_checks_on_primary = isinstance(domain_check_read_preference, Primary)
+# Causal sessions are only needed when some reads go to secondaries.
+uses_secondary_reads = not (
+    isinstance(domain_check_read_preference, Primary) and isinstance(project_read_preference, Primary)
+)
+
+
+@contextmanager
+def write_session() -> Iterator[ClientSession | None]:
+    """
+    Session for writes, records the write time for later secondary reads.
+    No session is needed when every read goes to the primary.
+    """
+    if not uses_secondary_reads:
+        yield None
+        return
+
+    with Project.start_session(causal_consistency=True) as session:
+        yield session
+        causal_clock.advance(session)
+
+        request_clock = request_causal_clock.get()
+        if request_clock is not None:
+            request_clock.advance(session)
+
+
+@contextmanager
+def read_session() -> Iterator[ClientSession]:
+    """Causally consistent session that starts after the latest write of this worker and of the client"""
+    with Project.start_session(causal_consistency=True) as session:
+        causal_clock.apply(session)
+
+        request_clock = request_causal_clock.get()
+        if request_clock is not None:
+            request_clock.apply(session)
+
+        yield session
+
+
+class CausalTokenMiddleware:
+    """
+    Read-your-writes across workers.
+
+    Responses to requests that wrote carry the "X-Causal-Token" header.
+    Clients send it back with their next requests, their secondary reads then wait
+    for that write, whichever worker made it.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for name, value in scope["headers"]:
+            if name == b"x-causal-token":
+                header = value.decode("latin-1")
+                break
+
+        # Sync endpoints run in a copied context, the clock object is shared with them.
+        clock = CausalClock.from_token(header)
+        token = request_causal_clock.set(clock)
+
+        async def send_with_causal_token(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                causal_token = clock.to_token()
+                if causal_token and causal_token != header:
+                    MutableHeaders(scope=message).append(CAUSAL_TOKEN_HEADER, causal_token)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_causal_token)
+        finally:
+            request_causal_clock.reset(token)
+
+
+def find_projects(filter: dict[str, Any], read_preference: _ServerMode) -> Iterator[Project]:
+    if isinstance(read_preference, Primary):
+        yield from Project.find(filter)
+        return
+
+    with read_session() as session:
+        for partition in Project.get_partitions(filter):
+            with use_partition(partition):
+                collection = Project._get_collection().with_options(read_preference=read_preference)
+
+            for data in collection.find(filter, session=session):
+                yield Project(**data)
+
+
+def find_one_project(filter: dict[str, Any], read_preference: _ServerMode) -> Project | None:
+    if isinstance(read_preference, Primary):
+        return Project.find_one(filter)
+
+    with read_session() as session:
+        for partition in Project.get_partitions(filter):
+            with use_partition(partition):
+                collection = Project._get_collection().with_options(read_preference=read_preference)
+
+            data = collection.find_one(filter, session=session)
+            if data is not None:
+                return Project(**data)
+
+    return None
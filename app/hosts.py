@@ -0,0 +1,101 @@
+from collections.abc import Iterable
+from enum import StrEnum
+from typing import Any, NamedTuple
+
+from app.config import SITE_DOMAINS, SUBDOMAIN_MAX_DEPTH
+
+# Key used to mark a trie node as the end of a configured base domain.
+# Labels never contain a space so it can't collide with a real label.
+_BASE_DOMAIN_KEY = " base"
+
+
+class HostKind(StrEnum):
+    SUBDOMAIN = "subdomain"
+    CUSTOM_DOMAIN = "custom_domain"
+    REJECT = "reject"
+
+
+class HostMatch(NamedTuple):
+    kind: HostKind
+    host: str
+    subdomain: str | None = None
+    base_domain: str | None = None
+
+
+# Builds a HostMatch from a complete tuple, skipping the keyword and default
+# handling of HostMatch(...) which is most of the cost of a lookup.
+_match = HostMatch._make
+
+
+def normalize_host(host: str) -> str:
+    """Lowercase the host and drop the port and the trailing root dot"""
+    host = host.strip().lower()
+
+    if ":" in host:
+        host = host.partition(":")[0]
+
+    return host.rstrip(".")
+
+
+class HostResolver:
+    """
+    Classify a hostname as one of our subdomains, a custom domain or reject it.
+
+    Base domains are compiled once into a trie keyed by reversed labels
+    ("example.com" => "com" -> "example") so a lookup only walks the labels
+    of the host once, independent of how many base domains are configured.
+    When base domains are nested ("example.com" and "eu.example.com")
+    the longest match wins.
+
+    max_depth is the number of labels allowed in front of the base domain.
+    The tenant subdomain is always the label right before the base domain,
+    e.g. with max_depth=2 "www.abc.example.com" resolves to "abc".
+    """
+
+    def __init__(self, base_domains: Iterable[str], max_depth: int = 1) -> None:
+        self.max_depth = max(max_depth, 1)
+        self.trie: dict[str, Any] = {}
+
+        for base_domain in base_domains:
+            base_domain = normalize_host(base_domain)
+            if not base_domain:
+                continue
+
+            node = self.trie
+            for label in reversed(base_domain.split(".")):
+                node = node.setdefault(label, {})
+            node[_BASE_DOMAIN_KEY] = base_domain
+
+    def resolve(self, host: str) -> HostMatch:
+        host = normalize_host(host)
+        labels = host.split(".")
+        if "" in labels:
+            return _match((HostKind.REJECT, host, None, None))
+
+        node = self.trie
+        base_domain: str | None = None
+        base_index = index = len(labels)
+
+        for label in reversed(labels):
+            node = node.get(label)
+            if node is None:
+                break
+
+            index -= 1
+            if _BASE_DOMAIN_KEY in node:
+                base_domain = node[_BASE_DOMAIN_KEY]
+                base_index = index
+
+        if base_domain is None:
+            if len(labels) < 2:
+                return _match((HostKind.REJECT, host, None, None))
+            return _match((HostKind.CUSTOM_DOMAIN, host, None, None))
+
+        # The base domain itself or a host deeper than allowed is not served.
+        if base_index == 0 or base_index > self.max_depth:
+            return _match((HostKind.REJECT, host, None, base_domain))
+
+        return _match((HostKind.SUBDOMAIN, host, labels[base_index - 1], base_domain))
+
+
+host_resolver = HostResolver(SITE_DOMAINS, SUBDOMAIN_MAX_DEPTH)
@@ -0,0 +1,80 @@
+import heapq
+import threading
+
+from app.config import HOT_KEYS_SIZE
+
+HOST = "host"
+PROJECT = "project"
+
+
+class SpaceSaving:
+    """
+    Approximate top-K counter (space-saving algorithm) in bounded memory.
+
+    At most capacity keys are counted. A new key replaces the least counted one
+    and inherits its count, so hot keys are never missed but counts of
+    newcomers are overestimated by at most the evicted count.
+
+    Keys are also grouped by count (stream-summary) so the least counted key
+    is found in O(1) instead of scanning every counter under the lock.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.counts: dict[str, int] = {}
+        # count => keys with that count, oldest first
+        self._buckets: dict[int, dict[str, None]] = {}
+        self._min_count = 0
+        self._lock = threading.Lock()
+
+    def add(self, key: str) -> None:
+        if self.capacity <= 0:
+            return
+
+        with self._lock:
+            count = self.counts.get(key)
+            if count is not None:
+                self._remove(key, count)
+            elif len(self.counts) < self.capacity:
+                count = 0
+            else:
+                count = self._min_count
+                evicted = next(iter(self._buckets[count]))
+                del self.counts[evicted]
+                self._remove(evicted, count)
+
+            self.counts[key] = count + 1
+            self._buckets.setdefault(count + 1, {})[key] = None
+            if count == 0:
+                self._min_count = 1
+
+    def _remove(self, key: str, count: int) -> None:
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if self._min_count == count:
+                # The key moves to count + 1, which is then the lowest bucket.
+                self._min_count = count + 1
+
+    def top(self, k: int) -> list[tuple[str, int]]:
+        with self._lock:
+            return heapq.nlargest(k, self.counts.items(), key=lambda item: item[1])
+
+    def decay(self) -> None:
+        """Halve every count so recent traffic outweighs old traffic"""
+        with self._lock:
+            self.counts = {key: count // 2 for key, count in self.counts.items() if count > 1}
+            self._buckets = {}
+            for key, count in self.counts.items():
+                self._buckets.setdefault(count, {})[key] = None
+            self._min_count = min(self._buckets, default=0)
+
+
+hot_hosts = SpaceSaving(HOT_KEYS_SIZE)
+hot_projects = SpaceSaving(HOT_KEYS_SIZE)
+
+trackers = {
+    HOST: hot_hosts,
+    PROJECT: hot_projects,
+}
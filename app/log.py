@@ -0,0 +1,267 @@
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import LOG_LEVEL, LOG_LEVELS, LOG_QUEUE_SIZE, LOG_SAMPLING
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Incoming ids are echoed in the logs, anything else is replaced by a new one.
+request_id_regex = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Attributes of every LogRecord, anything else was passed through `extra`.
+RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+current_request_id: ContextVar[str | None] = ContextVar("current_request_id", default=None)
+
+# Seconds between two warnings about records dropped on a full queue.
+DROPPED_REPORT_INTERVAL = 10
+
+
+def parse_logger_settings[T](value: str, cast: type[T]) -> dict[str, T]:
+    """Parse "logger=value,other.logger=value" settings"""
+    settings: dict[str, T] = {}
+    for item in value.split(","):
+        name, _, setting = item.partition("=")
+        if name.strip() and setting.strip():
+            settings[name.strip()] = cast(setting.strip())
+    return settings
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with the request id and the `extra` fields of the record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            data["request_id"] = request_id
+
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+    def formatTime(self, record: logging.LogRecord, datefmt: str | None = None) -> str:
+        created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        return f"{created}.{int(record.msecs):03d}Z"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of the records below WARNING of the configured loggers.
+    The closest configured parent applies, e.g. "app" also samples "app.routers".
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+        self._logger_rates: dict[str, float] = {}
+
+    def get_rate(self, name: str) -> float:
+        rate = self._logger_rates.get(name)
+        if rate is None:
+            rate = 1.0
+            parent = name
+            while parent:
+                if parent in self.rates:
+                    rate = self.rates[parent]
+                    break
+                parent = parent.rpartition(".")[0]
+            self._logger_rates[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self.get_rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hand the records to the listener thread without formatting them.
+
+    The stock QueueHandler formats the message in the calling thread,
+    here only the request id is captured and the listener does the rest.
+    When the queue is full the record is dropped instead of blocking the request,
+    `dropped` counts them.
+    """
+
+    def __init__(self, log_queue: queue.Queue[Any]) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.request_id = current_request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class LogListener(QueueListener):
+    """Write the queued records and warn about the dropped ones every DROPPED_REPORT_INTERVAL seconds"""
+
+    def __init__(self, queue_handler: LazyQueueHandler, *handlers: logging.Handler) -> None:
+        super().__init__(queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        self._reported = 0
+        self._reported_at = time.monotonic()
+
+    def handle(self, record: logging.LogRecord) -> None:
+        super().handle(record)
+
+        # Records are only dropped while the queue is full, so this keeps running meanwhile.
+        if time.monotonic() - self._reported_at >= DROPPED_REPORT_INTERVAL:
+            self.report_dropped()
+
+    def report_dropped(self) -> None:
+        self._reported_at = time.monotonic()
+        dropped = self.queue_handler.dropped
+        if dropped == self._reported:
+            return
+
+        record = logging.makeLogRecord(
+            {
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": logging.getLevelName(logging.WARNING),
+                "msg": "Dropped %s log records, the log queue is full (%s dropped since startup)",
+                "args": (dropped - self._reported, dropped),
+            }
+        )
+        self._reported = dropped
+        super().handle(record)
+
+    def enqueue_sentinel(self) -> None:
+        # The queue is bounded and may be full at shutdown, wait for the thread to make room.
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        super().stop()
+        self.report_dropped()
+
+
+_listener: LogListener | None = None
+
+
+def get_dropped_logs() -> int:
+    """Records dropped on a full queue since startup"""
+    if _listener is None:
+        return 0
+    return _listener.queue_handler.dropped
+
+
+def setup_logging() -> None:
+    """Send every log record through a queue to a JSON writer on stdout"""
+    global _listener
+    if _listener is not None:
+        return
+
+    # Not part of the JSON output, skip collecting them for every record.
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.logAsyncioTasks = False
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JSONFormatter())
+
+    log_queue: queue.Queue[Any] = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = LazyQueueHandler(log_queue)
+    sampling = parse_logger_settings(LOG_SAMPLING, float)
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    for name, level in parse_logger_settings(LOG_LEVELS, str).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = LogListener(queue_handler, stream_handler)
+    _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Write the queued records and stop the writer thread"""
+    global _listener
+    if _listener is None:
+        return
+
+    _listener.stop()
+    _listener = None
+
+
+def get_request_id(header: bytes | None) -> str:
+    if header:
+        request_id = header.decode("latin-1")
+        if request_id_regex.match(request_id):
+            return request_id
+    return uuid.uuid4().hex
+
+
+class RequestIdMiddleware:
+    """
+    Tag the logs of a request with the "X-Request-ID" header, or a new id,
+    and return it in the response.
+
+    Plain ASGI instead of BaseHTTPMiddleware, it runs on every request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        header = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                header = value
+                break
+
+        request_id = get_request_id(header)
+        token = current_request_id.set(request_id)
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            current_request_id.reset(token)
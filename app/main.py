@@ -7,15 +7,30 @@ from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from mongodb_odm import connect, disconnect
 
 from app import config, routers
+from app.cache import flush_hooks, invalidation_listener
+from app.db import CAUSAL_TOKEN_HEADER, CausalTokenMiddleware, uses_secondary_reads
+from app.log import RequestIdMiddleware, setup_logging, shutdown_logging
+from app.prewarm import hot_key_persister, prewarm_caches
+from app.profiling import ProfilingMiddleware, is_profiling_enabled
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # type: ignore
+    setup_logging()
     connect(config.DB_URL)
+    if config.PROJECT_CACHE_INVALIDATION is True:
+        invalidation_listener.start()
+    if config.HOT_KEYS_SIZE > 0:
+        hot_key_persister.start()
+        prewarm_caches()
+        flush_hooks.append(prewarm_caches)
 
     yield
 
+    hot_key_persister.stop()
+    invalidation_listener.stop()
     disconnect()
+    shutdown_logging()
 
 
 app: Any = FastAPI(debug=config.DEBUG, lifespan=lifespan)
@@ -25,6 +40,9 @@ app.add_middleware(
     allowed_hosts=["*"],
 )
 
+if uses_secondary_reads:
+    app.add_middleware(CausalTokenMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -32,8 +50,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[CAUSAL_TOKEN_HEADER],
 )
 
+if is_profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so the other middlewares log with the request id too
+app.add_middleware(RequestIdMiddleware)
+
 # Include API routes BEFORE static file serving
 app.include_router(routers.router, tags=["base"])
 
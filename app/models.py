@@ -1,6 +1,47 @@
+import logging
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
 from datetime import datetime
+from typing import Any, Self
 
-from mongodb_odm import ASCENDING, Document, Field, IndexModel
+from mongodb_odm import ASCENDING, DESCENDING, Document, Field, IndexModel, UpdateOne
+from mongodb_odm.connection import db
+from pymongo.collection import Collection
+from pymongo.cursor import Cursor
+from pymongo.errors import PyMongoError
+from pymongo.results import DeleteResult, UpdateResult
+
+from app.partitions import current_partition, project_partitioner, use_partition
+
+logger = logging.getLogger(__name__)
+
+# Project fields copied to the directory, besides the partition.
+DIRECTORY_FIELDS = frozenset({"subdomain", "custom_domain"})
+DIRECTORY_DATA_FIELDS = {"subdomain", "custom_domain", "partition"}
+
+
+def touches_directory(data: dict[str, Any]) -> bool:
+    """Does the update document, operators or replacement, change a field kept in the directory"""
+    if DIRECTORY_FIELDS & data.keys():
+        return True
+    return any(isinstance(value, dict) and DIRECTORY_FIELDS & value.keys() for value in data.values())
+
+
+class ProjectDirectory(Document):
+    """
+    Global routing table of a partitioned project collection.
+    The document id is the project id, lookups by id or custom domain use it to find the partition.
+    """
+
+    subdomain: str = Field(...)
+    custom_domain: str | None = Field(default=None)
+    partition: int = Field(...)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "project_directory"
+        indexes = [
+            IndexModel([("custom_domain", ASCENDING)]),
+        ]
 
 
 class Project(Document):
@@ -23,3 +64,343 @@ class Project(Document):
             IndexModel([("subdomain", ASCENDING)]),
             IndexModel([("custom_domain", ASCENDING)]),
         ]
+
+    @classmethod
+    def _get_collection(cls) -> Collection[Any]:
+        """
+        Collection of the partition selected with `use_partition`.
+        When partitioned, methods that aren't routed below fail outside of it
+        instead of silently using the first partition.
+        """
+        partition = current_partition()
+        if partition is None:
+            if project_partitioner.is_partitioned:
+                raise RuntimeError("Partitioned project query outside of use_partition()")
+            partition = 0
+
+        collection_name = project_partitioner.collection_name(cls._get_collection_name(), partition)
+        return db(cls._database_name())[collection_name]
+
+    @classmethod
+    def is_routed(cls) -> bool:
+        """Queries already go to a single collection"""
+        return not project_partitioner.is_partitioned or current_partition() is not None
+
+    @classmethod
+    def get_partitions(cls, filter: dict[str, Any]) -> list[int]:
+        """
+        Partitions that may hold documents matching the filter.
+        Subdomains are hashed directly, ids and custom domains go through the directory,
+        anything else has to scatter over every partition.
+        """
+        if not project_partitioner.is_partitioned:
+            return [0]
+
+        subdomain = filter.get("subdomain")
+        if isinstance(subdomain, str):
+            return [project_partitioner.partition_for(subdomain)]
+
+        for key in ("_id", "custom_domain"):
+            value = filter.get(key)
+            if value is None or isinstance(value, dict):
+                continue
+
+            directory = ProjectDirectory.find_one({key: value})
+            return [directory.partition] if directory else []
+
+        return project_partitioner.partitions()
+
+    @property
+    def partition(self) -> int:
+        return project_partitioner.partition_for(self.subdomain)
+
+    @classmethod
+    def find(
+        cls,
+        filter: dict[str, Any] | None = None,
+        projection: dict[str, Any] | None = None,
+        sort: Any = None,
+        skip: int | None = None,
+        limit: int | None = None,
+        **kwargs: Any,
+    ) -> Iterator[Self]:
+        if filter is None:
+            filter = {}
+
+        partitions = cls.get_partitions(filter)
+        if len(partitions) > 1 and (sort or skip):
+            raise ValueError("Sort and skip are not supported across project partitions")
+
+        count = 0
+        for partition in partitions:
+            with use_partition(partition):
+                qs = cls.find_raw(filter, projection, **kwargs)
+            if sort:
+                qs = qs.sort(sort)
+            if skip:
+                qs = qs.skip(skip)
+            if limit:
+                qs = qs.limit(limit - count)
+
+            for data in qs:
+                yield cls(**data)
+                count += 1
+
+            if limit and count >= limit:
+                return
+
+    @classmethod
+    def find_one(
+        cls,
+        filter: dict[str, Any] | None = None,
+        projection: dict[str, Any] | None = None,
+        sort: Any = None,
+        **kwargs: Any,
+    ) -> Self | None:
+        if filter is None:
+            filter = {}
+
+        for partition in cls.get_partitions(filter):
+            with use_partition(partition):
+                obj = super().find_one(filter, projection, sort, **kwargs)
+            if obj:
+                return obj
+        return None
+
+    @classmethod
+    def find_raw(
+        cls,
+        filter: dict[str, Any] | None = None,
+        projection: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> Cursor[Any]:
+        if cls.is_routed():
+            return super().find_raw(filter, projection, **kwargs)
+
+        partitions = cls.get_partitions(filter or {})
+        if len(partitions) > 1:
+            raise ValueError("A raw cursor can't span project partitions, use find() instead")
+        if not partitions:
+            # Not in the directory, nothing can match.
+            partitions, filter = [0], {"_id": {"$in": []}}
+
+        with use_partition(partitions[0]):
+            return super().find_raw(filter, projection, **kwargs)
+
+    @classmethod
+    def count_documents(cls, filter: dict[str, Any] | None = None, **kwargs: Any) -> int:
+        if cls.is_routed():
+            return super().count_documents(filter, **kwargs)
+
+        count = 0
+        for partition in cls.get_partitions(filter or {}):
+            with use_partition(partition):
+                count += super().count_documents(filter, **kwargs)
+        return count
+
+    @classmethod
+    def exists(cls, filter: dict[str, Any] | None = None, **kwargs: Any) -> bool:
+        if cls.is_routed():
+            return super().exists(filter, **kwargs)
+
+        for partition in cls.get_partitions(filter or {}):
+            with use_partition(partition):
+                if super().exists(filter, **kwargs):
+                    return True
+        return False
+
+    @classmethod
+    def update_one(cls, filter: dict[str, Any], data: dict[str, Any], **kwargs: Any) -> UpdateResult:
+        if cls.is_routed():
+            return super().update_one(filter, data, **kwargs)
+
+        if kwargs.get("upsert") or touches_directory(data):
+            raise ValueError("Upserts and subdomain or custom domain changes must go through create() or update()")
+
+        result = UpdateResult({"n": 0, "nModified": 0}, acknowledged=True)
+        for partition in cls.get_partitions(filter):
+            with use_partition(partition):
+                result = super().update_one(filter, data, **kwargs)
+            if result.matched_count:
+                break
+        return result
+
+    def create(self, **kwargs: Any) -> Self:
+        if not project_partitioner.is_partitioned:
+            return super().create(**kwargs)
+
+        # The directory is written first so a stored project is always reachable,
+        # the id generated on the model is used for both documents.
+        session = kwargs.get("session")
+        self.update_directory(None, session=session)
+        try:
+            with use_partition(self.partition):
+                self._get_collection().insert_one({"_id": self.id, **self.to_mongo()}, **kwargs)
+        except Exception:
+            self.restore_directory(None, session=session)
+            raise
+        return self
+
+    def update(self, raw: dict[str, Any] | None = None, **kwargs: Any) -> UpdateResult:
+        if not project_partitioner.is_partitioned:
+            return super().update(raw, **kwargs)
+
+        if raw and touches_directory(raw):
+            raise ValueError("Subdomain or custom domain changes must be set on the project, not in a raw update")
+
+        session = kwargs.get("session")
+        previous = ProjectDirectory.find_one({"_id": self.id}, session=session)
+        if previous is not None and previous.partition != self.partition:
+            if raw:
+                raise ValueError("A project moving to another partition can't be saved with a raw update")
+            return self.move(previous, **kwargs)
+
+        changed = self.update_directory(previous, session=session)
+        try:
+            with use_partition(self.partition):
+                return super().update(raw, **kwargs)
+        except Exception:
+            if changed:
+                self.restore_directory(previous, session=session)
+            raise
+
+    def move(self, previous: ProjectDirectory, **kwargs: Any) -> UpdateResult:
+        """
+        Save a project whose new subdomain hashes to another partition:
+        copy it to the new partition, then remove it from the previous one.
+        On failure the copy is removed and the directory put back, the project stays where it was.
+        """
+        session = kwargs.get("session")
+        self.updated_at = datetime.now()
+        self.update_directory(previous, session=session)
+        try:
+            with use_partition(self.partition):
+                self._get_collection().replace_one({"_id": self.id}, self.to_mongo(), upsert=True, **kwargs)
+            with use_partition(previous.partition):
+                result = self._get_collection().delete_one({"_id": self.id}, **kwargs)
+        except Exception:
+            try:
+                with use_partition(self.partition):
+                    self._get_collection().delete_one({"_id": self.id}, session=session)
+            except PyMongoError:
+                logger.exception("Failed to remove the copy of project %s from partition %s", self.id, self.partition)
+            self.restore_directory(previous, session=session)
+            raise
+
+        return UpdateResult({"n": result.deleted_count, "nModified": result.deleted_count}, acknowledged=True)
+
+    def delete(self, **kwargs: Any) -> DeleteResult:
+        # The project goes first, a leftover directory entry only keeps its custom domain taken.
+        with use_partition(self.partition):
+            result = super().delete(**kwargs)
+        if project_partitioner.is_partitioned:
+            ProjectDirectory.delete_one({"_id": self.id}, session=kwargs.get("session"))
+        return result
+
+    def get_directory_data(self) -> dict[str, Any]:
+        return {
+            "subdomain": self.subdomain,
+            "custom_domain": self.custom_domain,
+            "partition": self.partition,
+        }
+
+    def is_in_directory(self, entry: ProjectDirectory | None) -> bool:
+        """Does the directory entry match the project"""
+        return entry is not None and entry.model_dump(include=DIRECTORY_DATA_FIELDS) == self.get_directory_data()
+
+    def update_directory(self, previous: ProjectDirectory | None, session: Any = None) -> bool:
+        """Write the directory entry unless `previous` already matches, True when written"""
+        if self.is_in_directory(previous):
+            return False
+
+        ProjectDirectory.update_one({"_id": self.id}, {"$set": self.get_directory_data()}, upsert=True, session=session)
+        return True
+
+    def restore_directory(self, previous: ProjectDirectory | None, session: Any = None) -> None:
+        """Put back the directory entry after a failed project write"""
+        try:
+            if previous is None:
+                ProjectDirectory.delete_one({"_id": self.id}, session=session)
+            else:
+                data = previous.model_dump(include=DIRECTORY_DATA_FIELDS)
+                ProjectDirectory.update_one({"_id": self.id}, {"$set": data}, upsert=True, session=session)
+        except PyMongoError:
+            logger.exception(
+                "Failed to restore the directory entry of project %s, run scripts/partition_projects.py to rebuild it",
+                self.id,
+            )
+
+    @classmethod
+    def bulk_write_projects(cls, requests: Sequence[tuple[Self, UpdateOne]], **kwargs: Any) -> None:
+        """
+        Run bulk_write once per partition for updates of the paired project.
+        Projects must already hold the written values so the directory follows them.
+        """
+        if not requests:
+            return
+
+        session = kwargs.get("session")
+        previous: dict[Any, ProjectDirectory] = {}
+        changed: list[Self] = []
+        if project_partitioner.is_partitioned:
+            directory_filter = {"_id": {"$in": [project.id for project, _ in requests]}}
+            previous = {entry.id: entry for entry in ProjectDirectory.find(directory_filter, session=session)}
+            changed = [project for project, _ in requests if not project.is_in_directory(previous.get(project.id))]
+            for project in changed:
+                entry = previous.get(project.id)
+                if entry is not None and entry.partition != project.partition:
+                    raise ValueError("Bulk writes can't move projects to another partition, use update()")
+
+        if changed:
+            directory_requests = [
+                UpdateOne({"_id": project.id}, {"$set": project.get_directory_data()}, upsert=True)
+                for project in changed
+            ]
+            ProjectDirectory.bulk_write(directory_requests, session=session)
+
+        partition_requests: dict[int, list[UpdateOne]] = defaultdict(list)
+        for project, request in requests:
+            partition_requests[project.partition].append(request)
+
+        try:
+            for partition, write_requests in partition_requests.items():
+                with use_partition(partition):
+                    cls.bulk_write(write_requests, **kwargs)
+        except Exception:
+            for project in changed:
+                project.restore_directory(previous.get(project.id), session=session)
+            raise
+
+
+class CacheInvalidation(Document):
+    """Capped collection used to broadcast cache invalidation between workers"""
+
+    project_id: str = Field(...)
+    worker_id: str = Field(...)
+
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "cache_invalidation"
+
+
+class HotKey(Document):
+    """
+    Snapshot of the hottest hosts and projects of each worker, used to prewarm the caches.
+    Snapshots of workers that are gone expire after a day.
+    """
+
+    kind: str = Field(...)
+    key: str = Field(...)
+    worker_id: str = Field(...)
+    count: int = Field(default=0)
+
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "hot_key"
+        indexes = [
+            IndexModel([("kind", ASCENDING), ("worker_id", ASCENDING), ("key", ASCENDING)], unique=True),
+            IndexModel([("kind", ASCENDING), ("count", DESCENDING)]),
+            IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=24 * 60 * 60),
+        ]
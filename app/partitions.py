@@ -0,0 +1,54 @@
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.config import PROJECT_PARTITIONS
+
+
+class HashedPartitioner:
+    """
+    Spread tenants over N physical collections by a stable hash of the subdomain.
+
+    With a single partition the original collection name is kept,
+    so an unpartitioned deployment doesn't need any migration.
+    """
+
+    def __init__(self, count: int) -> None:
+        self.count = max(count, 1)
+
+    @property
+    def is_partitioned(self) -> bool:
+        return self.count > 1
+
+    def partitions(self) -> list[int]:
+        return list(range(self.count))
+
+    def partition_for(self, subdomain: str) -> int:
+        # crc32 is stable between processes, unlike the builtin hash()
+        return zlib.crc32(subdomain.encode()) % self.count
+
+    def collection_name(self, collection_name: str, partition: int) -> str:
+        if not self.is_partitioned:
+            return collection_name
+        return f"{collection_name}_{partition}"
+
+
+project_partitioner = HashedPartitioner(PROJECT_PARTITIONS)
+
+_current_partition: ContextVar[int | None] = ContextVar("project_partition", default=None)
+
+
+def current_partition() -> int | None:
+    """Partition selected with `use_partition`, None outside of it"""
+    return _current_partition.get()
+
+
+@contextmanager
+def use_partition(partition: int) -> Iterator[None]:
+    """Point every project query made inside the block to a single partition"""
+    token = _current_partition.set(partition)
+    try:
+        yield
+    finally:
+        _current_partition.reset(token)
@@ -0,0 +1,117 @@
+import logging
+import threading
+from datetime import datetime
+
+from mongodb_odm import ODMObjectId, UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.cache import WORKER_ID, domain_cache, project_cache
+from app.config import HOT_KEYS_PERSIST_INTERVAL, HOT_KEYS_TOP
+from app.db import domain_checks_on_primary
+from app.hotkeys import HOST, PROJECT, trackers
+from app.models import HotKey, Project
+from app.services import is_domain_allowed
+
+logger = logging.getLogger(__name__)
+
+
+def persist_hot_keys() -> None:
+    """Replace the snapshot of this worker with its current top keys"""
+    now = datetime.now()
+
+    for kind, tracker in trackers.items():
+        top = tracker.top(HOT_KEYS_TOP)
+        keys = [key for key, _ in top]
+
+        HotKey.delete_many({"kind": kind, "worker_id": WORKER_ID, "key": {"$nin": keys}})
+        if top:
+            HotKey.bulk_write(
+                [
+                    UpdateOne(
+                        {"kind": kind, "worker_id": WORKER_ID, "key": key},
+                        {"$set": {"count": count, "updated_at": now}},
+                        upsert=True,
+                    )
+                    for key, count in top
+                ]
+            )
+
+        tracker.decay()
+
+
+def load_hot_keys(kind: str) -> list[str]:
+    """Hottest keys over every worker snapshot"""
+    pipeline = [
+        {"$match": {"kind": kind}},
+        {"$group": {"_id": "$key", "count": {"$sum": "$count"}}},
+        {"$sort": {"count": -1}},
+        {"$limit": HOT_KEYS_TOP},
+    ]
+    return [data["_id"] for data in HotKey.aggregate(pipeline, get_raw=True)]
+
+
+def prewarm_caches() -> None:
+    """Fill the project and domain caches with the hottest keys"""
+    try:
+        project_ids = [ODMObjectId(key) for key in load_hot_keys(PROJECT) if ODMObjectId.is_valid(key)]
+        project_count = 0
+        if project_ids:
+            for project in Project.find({"_id": {"$in": project_ids}}):
+                project_cache.add(project)
+                project_count += 1
+
+        host_count = 0
+        hosts = load_hot_keys(HOST) if domain_cache.max_size > 0 and domain_checks_on_primary else []
+        for host in hosts:
+            cache_version = domain_cache.version
+            if is_domain_allowed(host):
+                domain_cache.fill(host, True, cache_version)
+                host_count += 1
+    except PyMongoError:
+        logger.exception("Failed to prewarm the caches")
+        return
+
+    logger.info("Prewarmed %s projects and %s hosts", project_count, host_count)
+
+
+class HotKeyPersister:
+    """Persist the hot keys of this worker every HOT_KEYS_PERSIST_INTERVAL seconds"""
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        try:
+            HotKey._get_collection().create_indexes(HotKey.ODMConfig.indexes)
+        except PyMongoError:
+            # The app can start without a reachable database, the index is created on a later start.
+            logger.exception("Failed to create the hot key indexes")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hot-key-persister", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._thread:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        # Keep what this worker learned for the next ones.
+        self._persist()
+
+    def _run(self) -> None:
+        while not self._stop.wait(HOT_KEYS_PERSIST_INTERVAL):
+            self._persist()
+
+    def _persist(self) -> None:
+        try:
+            persist_hot_keys()
+        except PyMongoError:
+            logger.exception("Failed to persist hot keys")
+
+
+hot_key_persister = HotKeyPersister()
@@ -0,0 +1,269 @@
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from contextvars import ContextVar
+from types import FrameType
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+
+from app.config import (
+    PROFILING_DIR,
+    PROFILING_MAX_FILES,
+    PROFILING_MODE,
+    PROFILING_SAMPLE_INTERVAL,
+    PROFILING_SAMPLE_RATE,
+    PROFILING_SECRET,
+)
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_MODE_HEADER = "X-Profile-Mode"
+PROFILE_OUTPUT_HEADER = "X-Profile-Output"
+
+DETERMINISTIC = "deterministic"
+SAMPLING = "sampling"
+
+INLINE_STATS_LIMIT = 50
+
+
+class DeterministicProfile:
+    """cProfile of the endpoint, saved as pstats"""
+
+    extension = "prof"
+
+    def __init__(self) -> None:
+        self.profiler = cProfile.Profile()
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def runcall(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return self.profiler.runcall(func, *args, **kwargs)
+
+    async def run_async(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        # Other coroutines running on the event loop meanwhile are profiled too.
+        self.profiler.enable()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.profiler.disable()
+
+    def save(self, path: str) -> None:
+        self.profiler.dump_stats(path)
+
+    def render(self) -> str:
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(INLINE_STATS_LIMIT)
+        return output.getvalue()
+
+
+def collapse_stack(frame: FrameType | None) -> str:
+    names: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfile:
+    """
+    Sample the stack of the threads running the endpoint from a background thread.
+    The result is saved as collapsed stacks, ready for flamegraph tools.
+    """
+
+    extension = "collapsed"
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.thread_ids: set[int] = set()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in tuple(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[collapse_stack(frame)] += 1
+
+    def runcall(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        thread_id = threading.get_ident()
+        self.thread_ids.add(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.thread_ids.discard(thread_id)
+
+    async def run_async(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        thread_id = threading.get_ident()
+        self.thread_ids.add(thread_id)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.thread_ids.discard(thread_id)
+
+    def render(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            file.write(self.render())
+
+
+RequestProfile = DeterministicProfile | SamplingProfile
+
+current_profile: ContextVar[RequestProfile | None] = ContextVar("current_profile", default=None)
+
+
+def profiled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """Run the endpoint under the profile of the current request, if there is one"""
+    if getattr(endpoint, "__profiled__", False):
+        # include_router() builds the route again from the already wrapped endpoint.
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            return await profile.run_async(endpoint, *args, **kwargs)
+
+        async_wrapper.__profiled__ = True  # type: ignore[attr-defined]
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        # Sync endpoints run in the threadpool, the context is copied there.
+        profile = current_profile.get()
+        if profile is None:
+            return endpoint(*args, **kwargs)
+        return profile.runcall(endpoint, *args, **kwargs)
+
+    wrapper.__profiled__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def is_profiling_enabled() -> bool:
+    return bool(PROFILING_SECRET)
+
+
+def get_route_class() -> type[APIRoute]:
+    """Plain routes unless profiling is configured, so it costs nothing when disabled"""
+    return ProfiledRoute if is_profiling_enabled() else APIRoute
+
+
+def is_profiling_secret(header: str | None) -> bool:
+    if not header or not PROFILING_SECRET:
+        return False
+    # Header values are decoded as latin-1, compare the raw bytes:
+    # compare_digest rejects non-ASCII strings with a TypeError.
+    return secrets.compare_digest(header.encode("latin-1"), PROFILING_SECRET.encode())
+
+
+def get_profile(mode: str | None) -> RequestProfile:
+    if (mode or PROFILING_MODE) == SAMPLING:
+        return SamplingProfile(PROFILING_SAMPLE_INTERVAL)
+    return DeterministicProfile()
+
+
+def prune_profiles(directory: str, max_files: int) -> None:
+    """Remove the oldest profiles so at most max_files are left"""
+    if max_files <= 0:
+        return
+
+    extensions = (f".{DeterministicProfile.extension}", f".{SamplingProfile.extension}")
+    profiles = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(extensions)]
+    if len(profiles) <= max_files:
+        return
+
+    profiles.sort(key=lambda entry: entry.stat().st_mtime)
+    for entry in profiles[:-max_files]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            # Already removed by a concurrent request.
+            pass
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Profile requests that carry the secret in the "X-Profile" header.
+
+    "X-Profile-Mode" picks deterministic or sampling, "X-Profile-Output: inline"
+    returns the profile instead of the response, otherwise it's saved to PROFILING_DIR
+    which keeps the latest PROFILING_MAX_FILES profiles.
+    """
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        if not is_profiling_secret(request.headers.get(PROFILE_HEADER)):
+            return await call_next(request)
+
+        if random.random() >= PROFILING_SAMPLE_RATE:
+            return await call_next(request)
+
+        profile = get_profile(request.headers.get(PROFILE_MODE_HEADER))
+        token = current_profile.set(profile)
+        profile.start()
+        try:
+            response = await call_next(request)
+        finally:
+            profile.stop()
+            current_profile.reset(token)
+
+        if request.headers.get(PROFILE_OUTPUT_HEADER) == "inline":
+            return Response(
+                content=profile.render(),
+                media_type="text/plain",
+                headers={"X-Profiled-Status": str(response.status_code)},
+            )
+
+        os.makedirs(PROFILING_DIR, exist_ok=True)
+        name = request.url.path.strip("/").replace("/", "_") or "root"
+        # The random suffix keeps concurrent profiles of the same path apart.
+        suffix = secrets.token_hex(4)
+        file_name = f"{int(time.time() * 1000)}-{request.method.lower()}-{name}-{suffix}.{profile.extension}"
+        path = os.path.join(PROFILING_DIR, file_name)
+        profile.save(path)
+        logger.info("Saved request profile to %s", path)
+        prune_profiles(PROFILING_DIR, PROFILING_MAX_FILES)
+
+        response.headers["X-Profile-Path"] = os.path.basename(path)
+        return response
@@ -3,9 +3,16 @@ from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 
-from app.config import DEBUG, LOCAL_SUBDOMAIN, SITE_DOMAIN
+from app.cache import cache_project, domain_cache, evict_project
+from app.config import DEBUG, LOCAL_SUBDOMAIN
+from app.db import domain_checks_on_primary, find_projects, project_read_preference, write_session
+from app.hosts import HostKind, host_resolver, normalize_host
+from app.hotkeys import hot_hosts
 from app.models import Project
+from app.profiling import get_route_class
 from app.schemas import (
+    BulkCustomDomainIn,
+    BulkCustomDomainOut,
     CustomDomainIn,
     DomainVerificationOut,
     ProjectIn,
@@ -18,19 +25,32 @@ from app.services import (
     get_sanitized_custom_domain,
     get_verification_record_name,
     is_customdomain_available,
+    is_domain_allowed,
     remove_custom_domain,
     set_custom_domain,
+    set_custom_domains,
     verify_custom_domain,
 )
 from app.utils import update_partially
 
-router = APIRouter(prefix="/api")
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api", route_class=get_route_class())
 
 
 def get_subdomain_from_request(request: Request) -> str | None:
     subdomain = request.headers.get("X-Subdomain")
     if DEBUG is True and subdomain == LOCAL_SUBDOMAIN:
         return LOCAL_SUBDOMAIN
+
+    # The frontend sends its full host as "X-Custom-Domain",
+    # if that host is under one of our base domains it decides the subdomain.
+    host = request.headers.get("X-Custom-Domain")
+    if host:
+        match = host_resolver.resolve(host)
+        if match.kind == HostKind.SUBDOMAIN:
+            return match.subdomain
+
     if not subdomain:
         return None
 
@@ -44,7 +64,14 @@ def get_custom_domain_from_request(request: Request) -> str | None:
     if not custom_domain:
         return None
 
-    return custom_domain.lower()
+    match = host_resolver.resolve(custom_domain)
+    if match.kind == HostKind.SUBDOMAIN:
+        # Scoped by get_subdomain_from_request.
+        return None
+
+    # A rejected host is still used as the scope, no project has it as custom domain
+    # so nothing matches instead of dropping the scope.
+    return match.host or custom_domain
 
 
 @router.get("/projects")
@@ -58,7 +85,7 @@ def get_projects(
     elif custom_domain:
         filter["custom_domain"] = custom_domain
 
-    query = Project.find(filter)
+    query = find_projects(filter, project_read_preference)
 
     projects = [ProjectOut(**project.model_dump()) for project in query]
 
@@ -75,7 +102,8 @@ def create_project(project_data: ProjectIn):
 
     new_project = Project(**project_dict)
     new_project.is_active = True
-    new_project.create()
+    with write_session() as session:
+        new_project.create(session=session)
 
     return ProjectOut(**new_project.model_dump())
 
@@ -86,7 +114,7 @@ def get_project(
     subdomain: str = Depends(get_subdomain_from_request),
     custom_domain: str = Depends(get_custom_domain_from_request),
 ):
-    project = get_project_or_404(project_id, subdomain, custom_domain)
+    project = get_project_or_404(project_id, subdomain, custom_domain, read_only=True)
 
     return ProjectOut(**project.model_dump())
 
@@ -99,7 +127,9 @@ def update_project(
     existing_project = get_project_or_404(project_id)
 
     existing_project = update_partially(existing_project, project_data)
-    existing_project.update()
+    with write_session() as session:
+        existing_project.update(session=session)
+    cache_project(existing_project)
 
     return ProjectOut(**existing_project.model_dump())
 
@@ -112,7 +142,9 @@ def delete_project(
 ):
     project = get_project_or_404(project_id, subdomain, custom_domain)
 
-    project.delete()
+    with write_session() as session:
+        project.delete(session=session)
+    evict_project(str(project.id))
 
     return {"detail": "Project deleted successfully"}
 
@@ -168,6 +200,14 @@ def add_custom_domain(
     )
 
 
+@router.post("/custom-domains/bulk")
+def add_custom_domains(domain_data: BulkCustomDomainIn) -> BulkCustomDomainOut:
+    """Add custom domains to many projects, every domain gets its own result"""
+    results = set_custom_domains(domain_data.domains)
+
+    return BulkCustomDomainOut(results=results)
+
+
 @router.post("/projects/{project_id}/verify-domain")
 def verify_domain(project_id: str) -> dict[str, Any]:
     """Verify the custom domain for a project"""
@@ -221,7 +261,7 @@ def remove_domain(project_id: str) -> dict[str, str]:
 @router.get("/projects/{project_id}/custom-domain/instructions")
 def get_domain_instructions(project_id: str) -> dict[str, Any]:
     """Get detailed instructions for domain verification"""
-    project = get_project_or_404(project_id)
+    project = get_project_or_404(project_id, read_only=True)
 
     if not project.subdomain:
         raise HTTPException(
@@ -240,6 +280,7 @@ def get_domain_instructions(project_id: str) -> dict[str, Any]:
         domain=project.custom_domain,
         token=project.domain_verification_token,
         subdomain=project.subdomain,
+        project_id=project_id,
     )
 
     return {
@@ -261,54 +302,22 @@ async def domain_check(domain: str | None = None) -> Any:
     to isolate the original API server on it's dedicated server.
     """
 
-    logging.info(f"Checking domain: {domain}")
+    logger.info("Checking domain %s", domain)
 
     if not domain:
         return Response(status_code=403)
 
-    def get_subdomain_from_host(host: str) -> str | None:
-        if not host.endswith(SITE_DOMAIN):
-            return None
-
-        parts = host.split(".")
-        if len(parts) < 3:
-            return None
-
-        subdomain = parts[0]
-
-        return subdomain
-
-    def is_project_exists(filter: dict[str, Any]) -> bool:
-        project = Project.find_one(filter)
-
-        if project:
-            return True
-
-        return False
-
-    def is_valid_subdomain(subdomain: str) -> bool:
-        filter: dict[str, Any] = {
-            "subdomain": subdomain,
-            "is_active": True,
-        }
-
-        return is_project_exists(filter)
-
-    def is_valid_domain(custom_domain: str) -> bool:
-        filter: dict[str, Any] = {
-            "is_active": True,
-            "is_verified": True,
-            "custom_domain": custom_domain,
-        }
-
-        return is_project_exists(filter)
-
-    subdomain = get_subdomain_from_host(domain)
-
-    if subdomain and is_valid_subdomain(subdomain):
+    host = normalize_host(domain)
+    if domain_cache.get(host):
+        hot_hosts.add(host)
         return Response(status_code=200)
 
-    if is_valid_domain(domain):
+    # Read before the lookup, a write clearing the cache meanwhile keeps this answer out of it.
+    cache_version = domain_cache.version
+    if is_domain_allowed(host):
+        if domain_checks_on_primary:
+            domain_cache.fill(host, True, cache_version)
+        hot_hosts.add(host)
         return Response(status_code=200)
 
     return Response(status_code=403)
@@ -32,3 +32,27 @@ class DomainVerificationOut(BaseModel):
     verification_record_name: str
     verification_record_value: str
     instructions: str
+
+
+MAX_BULK_CUSTOM_DOMAINS = 1000
+
+
+class CustomDomainAssignmentIn(BaseModel):
+    project_id: str
+    custom_domain: str
+
+
+class BulkCustomDomainIn(BaseModel):
+    domains: list[CustomDomainAssignmentIn] = Field(..., min_length=1, max_length=MAX_BULK_CUSTOM_DOMAINS)
+
+
+class CustomDomainResultOut(BaseModel):
+    project_id: str
+    custom_domain: str
+    success: bool
+    detail: str | None = None
+    verification: dict[str, str] | None = None
+
+
+class BulkCustomDomainOut(BaseModel):
+    results: list[CustomDomainResultOut]
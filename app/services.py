@@ -1,14 +1,25 @@
+import logging
 import re
 import secrets
 import string
 from datetime import datetime
 from typing import Any
 
+import idna
 from fastapi import HTTPException, status
-from mongodb_odm import ODMObjectId
+from mongodb_odm import ODMObjectId, UpdateOne
+from pymongo.read_preferences import Primary
 
+from app.cache import cache_project, cache_projects, project_cache
 from app.config import SITE_DOMAIN
-from app.models import Project
+from app.db import domain_check_read_preference, find_one_project, project_read_preference, write_session
+from app.hosts import HostKind, host_resolver
+from app.hotkeys import hot_projects
+from app.models import Project, ProjectDirectory
+from app.partitions import project_partitioner
+from app.schemas import CustomDomainAssignmentIn, CustomDomainResultOut
+
+logger = logging.getLogger(__name__)
 
 MAX_CONFIGURE_RETRY = 5
 SUBDOMAIN_CHARS = string.ascii_lowercase + string.digits
@@ -60,6 +71,8 @@ If the custom domain configuration failed use "/api/projects/{project_id}/re-con
 
 # Subdomain should not start or end with a hyphen, and must be 3-63 characters long
 subdomain_regex = re.compile(r"^(?!-)[a-zA-Z0-9-]{3,63}(?<!-)$")
+# At least two ASCII (punycode) labels of 1-63 characters that don't start or end with a hyphen
+domain_regex = re.compile(r"^(?=.{1,253}$)(?:(?!-)[a-z0-9-]{1,63}(?<!-)\.)+(?!-)[a-z0-9-]{1,63}(?<!-)$")
 reserved_subdomains = {
     "www",
     "api",
@@ -136,29 +149,59 @@ def get_sanitized_custom_domain(custom_domain: str | None) -> str | None:
     if not custom_domain:
         return None
 
-    custom_domain = custom_domain.strip().lower()
+    ascii_domain = to_ascii_domain(custom_domain)
 
-    if not validate_domain_format(custom_domain):
+    error = get_custom_domain_error(ascii_domain)
+    if error:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid custom domain format. Please provide a valid domain.",
+            detail=f"{error}. Please provide a valid domain.",
         )
 
-    return custom_domain
-
-
-def get_project_or_404(project_id: str, subdomain: str | None = None, custom_domain: str | None = None) -> Project:
-    filter: dict[str, Any] = {"_id": ODMObjectId(project_id)}
-
-    if subdomain:
-        filter["subdomain"] = subdomain
-    elif custom_domain:
-        filter["custom_domain"] = custom_domain
+    return ascii_domain
+
+
+def get_project_or_404(
+    project_id: str,
+    subdomain: str | None = None,
+    custom_domain: str | None = None,
+    read_only: bool = False,
+) -> Project:
+    """
+    Read-only endpoints use the cache and PROJECT_READ_PREFERENCE.
+    Projects that are going to be written are always read from the primary,
+    `update()` writes the whole document back.
+    """
+    if not ODMObjectId.is_valid(project_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+    # Same key as the cached `str(project.id)`, whatever the case of the given id.
+    project_id = str(ODMObjectId(project_id))
+
+    existing_project = project_cache.get(project_id) if read_only else None
+    use_secondary = read_only and not isinstance(project_read_preference, Primary)
+
+    if existing_project is None and use_secondary:
+        # Possibly stale secondary reads never populate the cache.
+        existing_project = find_one_project({"_id": ODMObjectId(project_id)}, project_read_preference)
+    elif existing_project is None:
+        cache_version = project_cache.version
+        existing_project = Project.find_one({"_id": ODMObjectId(project_id)})
+        if existing_project:
+            project_cache.fill_project(existing_project, cache_version)
+
+    # Check the request scope against the project, cached or not.
+    if existing_project and subdomain:
+        if existing_project.subdomain != subdomain:
+            existing_project = None
+    elif existing_project and custom_domain:
+        if existing_project.custom_domain != custom_domain:
+            existing_project = None
 
-    existing_project = Project.find_one(filter)
     if not existing_project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
 
+    hot_projects.add(project_id)
+
     return existing_project
 
 
@@ -174,6 +217,37 @@ def is_customdomain_available(custom_domain: str) -> bool:
     return existing_project is None
 
 
+def get_taken_custom_domains(custom_domains: list[str]) -> dict[str, str]:
+    """Map every already used domain of the list to its project id with a single query"""
+    filter: dict[str, Any] = {"custom_domain": {"$in": custom_domains}}
+    # The directory holds every custom domain when projects are partitioned.
+    model: type[Project] | type[ProjectDirectory] = ProjectDirectory if project_partitioner.is_partitioned else Project
+
+    return {data["custom_domain"]: str(data["_id"]) for data in model.find_raw(filter, {"custom_domain": 1})}
+
+
+def is_domain_allowed(domain: str) -> bool:
+    """Is the host one of our active subdomains or a verified custom domain"""
+    match = host_resolver.resolve(domain)
+
+    filter: dict[str, Any]
+    if match.kind == HostKind.SUBDOMAIN and match.subdomain:
+        filter = {
+            "subdomain": match.subdomain,
+            "is_active": True,
+        }
+    elif match.kind == HostKind.CUSTOM_DOMAIN:
+        filter = {
+            "is_active": True,
+            "is_verified": True,
+            "custom_domain": match.host,
+        }
+    else:
+        return False
+
+    return find_one_project(filter, domain_check_read_preference) is not None
+
+
 def get_project_by_custom_domain(domain: str) -> Project | None:
     """Get project by custom domain"""
     return Project.find_one({"custom_domain": domain, "is_active": True})
@@ -189,29 +263,37 @@ def get_verification_record_name(domain: str) -> str:
     return f"_domain-verification.{domain}"
 
 
-def validate_domain_format(domain: str) -> bool:
-    """Validate domain format"""
+def to_ascii_domain(domain: str) -> str | None:
+    """
+    Lowercase and IDNA encode the domain, None if it can't be encoded.
+    UTS 46 / IDNA 2008 like browsers, the codec of the standard library is IDNA 2003
+    and maps e.g. "straße.de" to a different domain.
+    """
+    domain = domain.strip().lower().rstrip(".")
+    if domain.isascii():
+        return domain
+
     try:
-        # Basic format validation
-        if not domain or "." not in domain:
-            return False
+        return idna.encode(domain, uts46=True).decode("ascii")
+    except UnicodeError:
+        return None
 
-        parts = domain.split(".")
-        if len(parts) < 2:
-            return False
 
-        # Check each part
-        for part in parts:
-            if not part or part.startswith("-") or part.endswith("-"):
-                return False
+def get_custom_domain_error(ascii_domain: str | None) -> str | None:
+    """
+    Why the IDNA encoded domain can't be a custom domain, None if it can.
+    Hosts under our base domains are served as subdomains, never as custom domains.
+    """
+    if not ascii_domain or not domain_regex.match(ascii_domain):
+        return "Invalid custom domain format"
+    if host_resolver.resolve(ascii_domain).kind != HostKind.CUSTOM_DOMAIN:
+        return "Domain can't be used as a custom domain"
+    return None
 
-            # Check if all characters are valid
-            if not all(c.isalnum() or c == "-" for c in part):
-                return False
 
-        return True
-    except Exception:
-        return False
+def validate_domain_format(domain: str) -> bool:
+    """Validate domain format"""
+    return get_custom_domain_error(to_ascii_domain(domain)) is None
 
 
 def check_domain_verification(domain: str, token: str) -> bool:
@@ -220,13 +302,13 @@ def check_domain_verification(domain: str, token: str) -> bool:
         import dns.exception
         import dns.resolver
     except ImportError:
-        print("❌ dnspython not installed. Install with: pip install dnspython")
+        logger.error("dnspython not installed. Install with: pip install dnspython")
         return False
 
     verification_record_name = get_verification_record_name(domain)
+    log_extra = {"domain": domain, "record_name": verification_record_name}
 
-    print(f"Verifying domain {domain} with token {token}")
-    print(f"Looking for TXT record: {verification_record_name} = {token}")
+    logger.info("Looking for TXT record %s = %s", verification_record_name, token, extra=log_extra)
 
     try:
         # Configure resolver with timeout
@@ -240,7 +322,7 @@ def check_domain_verification(domain: str, token: str) -> bool:
 
             # Check if we have any records
             if not answers.rrset:
-                print(f"❌ No TXT records found for {verification_record_name}")
+                logger.info("No TXT records found for %s", verification_record_name, extra=log_extra)
                 return False
 
             # Iterate through the TXT records in the rrset
@@ -256,42 +338,38 @@ def check_domain_verification(domain: str, token: str) -> bool:
                 else:
                     txt_value = txt_content
 
-                print(f"Found TXT record: '{txt_value}'")
+                logger.debug("Found TXT record %r", txt_value, extra=log_extra)
 
                 # Check if this record matches our verification token
                 if txt_value == token:
-                    print(f"✅ Domain verification successful for {domain}")
+                    logger.info("Domain verification successful for %s", domain, extra=log_extra)
                     return True
 
-            print(f"❌ Verification token not found in TXT records for {verification_record_name}")
-            print(f"Expected: '{token}'")
+            logger.info("Token %r not found in TXT records for %s", token, verification_record_name, extra=log_extra)
             return False
 
         except dns.resolver.NXDOMAIN:
-            print(f"❌ DNS record {verification_record_name} does not exist")
-            print("Please add the following TXT record to your DNS:")
-            print(f"Name: {verification_record_name}")
-            print(f"Value: {token}")
+            logger.info("DNS record %s does not exist", verification_record_name, extra=log_extra)
             return False
 
         except dns.resolver.NoAnswer:
-            print(f"❌ No TXT records found for {verification_record_name}")
+            logger.info("No TXT records found for %s", verification_record_name, extra=log_extra)
             return False
 
         except dns.resolver.Timeout:
-            print(f"❌ DNS query timeout for {verification_record_name}")
+            logger.warning("DNS query timeout for %s", verification_record_name, extra=log_extra)
             return False
 
     except dns.exception.DNSException as e:
-        print(f"❌ DNS query failed for {verification_record_name}: {str(e)}")
+        logger.warning("DNS query failed for %s: %s", verification_record_name, e, extra=log_extra)
         return False
 
-    except Exception as e:
-        print(f"❌ Unexpected error during DNS verification: {str(e)}")
+    except Exception:
+        logger.exception("Unexpected error during DNS verification", extra=log_extra)
         return False
 
 
-def get_domain_verification_instructions(token: str, domain: str, subdomain: str) -> dict[str, str]:
+def get_domain_verification_instructions(token: str, domain: str, subdomain: str, project_id: str) -> dict[str, str]:
     """Get detailed instructions for domain verification"""
     verification_record_name = get_verification_record_name(domain)
 
@@ -303,7 +381,7 @@ def get_domain_verification_instructions(token: str, domain: str, subdomain: str
         token=token,
         verification_record_name=verification_record_name,
     )
-    troubleshooting_data = troubleshooting_template.format(domain=domain)
+    troubleshooting_data = troubleshooting_template.format(domain=domain, project_id=project_id)
 
     return {
         "domain": domain,
@@ -339,7 +417,9 @@ def set_custom_domain(project: Project, domain: str) -> Project:
     project.domain_verified_at = None
     project.updated_at = datetime.now()
 
-    project.update()
+    with write_session() as session:
+        project.update(session=session)
+    cache_project(project)
     return project
 
 
@@ -357,7 +437,9 @@ def verify_custom_domain(project: Project) -> bool:
         project.is_verified = True
         project.domain_verified_at = datetime.now()
         project.updated_at = datetime.now()
-        project.update()
+        with write_session() as session:
+            project.update(session=session)
+        cache_project(project)
 
     return is_verified
 
@@ -370,6 +452,89 @@ def remove_custom_domain(project: Project) -> Project:
     project.domain_verified_at = None
     project.updated_at = datetime.now()
 
-    project.update()
+    with write_session() as session:
+        project.update(session=session)
+    cache_project(project)
 
     return project
+
+
+def set_custom_domains(assignments: list[CustomDomainAssignmentIn]) -> list[CustomDomainResultOut]:
+    """
+    Assign custom domains to many projects at once.
+    Domains are validated together, checked with one query and written with one bulk write,
+    each assignment gets its own result with the verification instructions.
+    """
+    results = [
+        CustomDomainResultOut(project_id=item.project_id, custom_domain=item.custom_domain, success=False)
+        for item in assignments
+    ]
+    domains = [to_ascii_domain(item.custom_domain) for item in assignments]
+
+    # Canonical ids, they are compared with `str(project.id)`.
+    project_ids: list[str] = []
+    for item, result in zip(assignments, results, strict=True):
+        if ODMObjectId.is_valid(item.project_id):
+            project_ids.append(str(ODMObjectId(item.project_id)))
+        else:
+            project_ids.append("")
+            result.detail = "Invalid project id"
+
+    project_filter = {"_id": {"$in": [ODMObjectId(project_id) for project_id in project_ids if project_id]}}
+    projects = {str(project.id): project for project in Project.find(project_filter)}
+    taken_domains = get_taken_custom_domains([domain for domain in domains if domain])
+
+    seen_domains: set[str] = set()
+    seen_projects: set[str] = set()
+    requests: list[tuple[Project, UpdateOne]] = []
+    for project_id, domain, result in zip(project_ids, domains, results, strict=True):
+        if result.detail:
+            continue
+
+        project = projects.get(project_id)
+        domain_error = get_custom_domain_error(domain)
+        if not project:
+            result.detail = "Project not found"
+        elif domain_error:
+            result.detail = domain_error
+        elif domain in seen_domains or taken_domains.get(domain, project_id) != project_id:
+            result.detail = f"Custom domain '{domain}' is already taken."
+        elif project_id in seen_projects:
+            result.detail = "Project appears more than once"
+
+        if result.detail or not project or not domain:
+            continue
+
+        seen_domains.add(domain)
+        seen_projects.add(project_id)
+
+        project.custom_domain = domain
+        project.domain_verification_token = generate_verification_token()
+        project.is_verified = False
+        project.domain_verified_at = None
+        project.updated_at = datetime.now()
+
+        fields = {
+            "custom_domain",
+            "domain_verification_token",
+            "is_verified",
+            "domain_verified_at",
+            "updated_at",
+        }
+        requests.append((project, UpdateOne({"_id": project.id}, {"$set": project.model_dump(include=fields)})))
+
+        result.success = True
+        result.verification = get_domain_verification_instructions(
+            token=project.domain_verification_token,
+            domain=domain,
+            subdomain=project.subdomain,
+            project_id=project_id,
+        )
+
+    if requests:
+        with write_session() as session:
+            Project.bulk_write_projects(requests, session=session)
+
+        cache_projects([project for project, _ in requests])
+
+    return results
@@ -6,12 +6,20 @@ const URLS = {
   projectDetails: (id: string) => `${API_BASE_URL}/api/projects/${id}`,
 };
 
+// Latest write seen by this client, lets the API read it back from any worker
+const CAUSAL_TOKEN_HEADER = "X-Causal-Token";
+let causalToken: string | null = null;
+
 const getHeaders = () => {
   const headers = {
     "Content-Type": "application/json",
     Accept: "application/json",
   } as Record<string, string>;
 
+  if (causalToken) {
+    headers[CAUSAL_TOKEN_HEADER] = causalToken;
+  }
+
   if (SUBDOMAIN) {
     headers["X-Subdomain"] = SUBDOMAIN;
   }
@@ -24,6 +32,8 @@ const getHeaders = () => {
 };
 
 const handleApiResponse = async (response: Response) => {
+  causalToken = response.headers.get(CAUSAL_TOKEN_HEADER) || causalToken;
+
   if (!response.ok) {
     const errorText = await response.text();
     let errorMessage = `HTTP error! status: ${response.status}`;
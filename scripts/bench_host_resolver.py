@@ -0,0 +1,115 @@
+"""
+Micro-benchmark for the host resolver used by the domain check.
+
+Compares the legacy single domain check, a longest suffix loop over the base domains
+with the same classification as the resolver, and the resolver itself,
+with the configured handful of base domains and with many of them.
+
+Run from the project root:
+    uv run python -m scripts.bench_host_resolver
+"""
+
+import random
+import string
+import time
+from collections.abc import Callable
+
+from app.hosts import HostKind, HostMatch, HostResolver, normalize_host
+
+TOTAL_HOSTS = 1_000_000
+BASE_DOMAINS = ["example.com", "eu.example.com", "example.io", "example.co.uk"]
+MANY_BASE_DOMAINS = 100
+MAX_DEPTH = 2
+
+
+def random_label(length: int = 8) -> str:
+    return "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
+
+
+def generate_hosts(total: int, base_domains: list[str]) -> list[str]:
+    hosts: list[str] = []
+    for _ in range(total):
+        kind = random.random()
+        if kind < 0.5:
+            hosts.append(f"{random_label()}.{random.choice(base_domains)}")
+        elif kind < 0.6:
+            hosts.append(f"www.{random_label()}.{random.choice(base_domains)}")
+        elif kind < 0.9:
+            hosts.append(f"{random_label()}.{random.choice(['com', 'net', 'org', 'dev'])}")
+        else:
+            hosts.append(random.choice(["", "localhost", "a..b", random.choice(base_domains)]))
+    return hosts
+
+
+def legacy_subdomain_from_host(host: str, site_domain: str) -> str | None:
+    if not host.endswith(site_domain):
+        return None
+
+    parts = host.split(".")
+    if len(parts) < 3:
+        return None
+
+    return parts[0]
+
+
+class SuffixLoopResolver:
+    """Same results as HostResolver, checking each base domain in turn, longest first"""
+
+    def __init__(self, base_domains: list[str], max_depth: int) -> None:
+        self.max_depth = max_depth
+        self.base_domains = sorted((normalize_host(domain) for domain in base_domains), key=len, reverse=True)
+
+    def resolve(self, host: str) -> HostMatch:
+        host = normalize_host(host)
+        labels = host.split(".")
+        if "" in labels:
+            return HostMatch._make((HostKind.REJECT, host, None, None))
+
+        for base_domain in self.base_domains:
+            if host == base_domain:
+                return HostMatch._make((HostKind.REJECT, host, None, base_domain))
+            if host.endswith(base_domain) and host[-len(base_domain) - 1] == ".":
+                base_index = len(labels) - base_domain.count(".") - 1
+                if base_index > self.max_depth:
+                    return HostMatch._make((HostKind.REJECT, host, None, base_domain))
+                return HostMatch._make((HostKind.SUBDOMAIN, host, labels[base_index - 1], base_domain))
+
+        if len(labels) < 2:
+            return HostMatch._make((HostKind.REJECT, host, None, None))
+        return HostMatch._make((HostKind.CUSTOM_DOMAIN, host, None, None))
+
+
+def measure(label: str, resolve: Callable[[str], object], hosts: list[str]) -> None:
+    start = time.perf_counter()
+    for host in hosts:
+        resolve(host)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<38} {elapsed:.3f}s ({elapsed / len(hosts) * 1e9:.0f} ns)")
+
+
+def compare(base_domains: list[str], hosts: list[str]) -> None:
+    resolver = HostResolver(base_domains, MAX_DEPTH)
+    suffix_loop = SuffixLoopResolver(base_domains, MAX_DEPTH)
+    mismatches = sum(resolver.resolve(host) != suffix_loop.resolve(host) for host in hosts[:10_000])
+    assert mismatches == 0, f"{mismatches} hosts resolved differently"
+
+    print(f"Hosts: {len(hosts):,} across {len(base_domains)} base domains")
+    measure("Legacy endswith (single domain)", lambda host: legacy_subdomain_from_host(host, base_domains[0]), hosts)
+    measure("Suffix loop (all domains)", suffix_loop.resolve, hosts)
+    measure("HostResolver (all domains)", resolver.resolve, hosts)
+
+
+def main() -> None:
+    random.seed(42)
+    hosts = generate_hosts(TOTAL_HOSTS, BASE_DOMAINS)
+    compare(BASE_DOMAINS, hosts)
+
+    print()
+    extra_domains = [f"{random_label()}.{random.choice(['com', 'net', 'org'])}" for _ in range(MANY_BASE_DOMAINS)]
+    many_domains = BASE_DOMAINS + extra_domains
+    hosts = generate_hosts(TOTAL_HOSTS, many_domains)
+    compare(many_domains, hosts)
+
+
+if __name__ == "__main__":
+    main()
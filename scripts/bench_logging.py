@@ -0,0 +1,148 @@
+"""
+Log cost per request, before and after the queue based JSON logging.
+
+"before" writes the lines of a domain verification with print() and the domain check
+with an f-string through a synchronous StreamHandler, "after" sends the same lines
+through LazyQueueHandler and lets the listener thread format and write them.
+Both write to an unbuffered pipe, like stdout in the container (PYTHONUNBUFFERED=1),
+drained by a reader that can be slowed down to mimic a busy log collector.
+The time spent in the request threads is measured.
+
+Run from the project root:
+    uv run python -m scripts.bench_logging [reader delay in ms per 64KB]
+"""
+
+import io
+import logging
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from logging.handlers import QueueListener
+from typing import IO, Any
+
+from app.log import JSONFormatter, LazyQueueHandler
+
+TOTAL_REQUESTS = 20_000
+THREADS = 4
+DOMAIN = "shop.example.org"
+RECORD_NAME = "_verify.shop.example.org"
+TOKEN = "d41d8cd98f00b204e9800998ecf8427e"
+
+
+@contextmanager
+def pipe_sink(read_delay: float) -> Iterator[IO[str]]:
+    read_fd, write_fd = os.pipe()
+
+    def drain() -> None:
+        while os.read(read_fd, 65536):
+            time.sleep(read_delay)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    sink = io.TextIOWrapper(open(write_fd, "wb", buffering=0), write_through=True)
+    try:
+        yield sink
+    finally:
+        sink.close()
+        reader.join()
+        os.close(read_fd)
+
+
+def print_request(sink: IO[str], logger: logging.Logger) -> None:
+    logger.info(f"Checking domain: {DOMAIN}")
+    print(f"Verifying domain {DOMAIN} with token {TOKEN}", file=sink)
+    print(f"Looking for TXT record: {RECORD_NAME} = {TOKEN}", file=sink)
+    for _ in range(3):
+        print(f"Found TXT record: '{TOKEN[::-1]}'", file=sink)
+    print(f"❌ Verification token not found in TXT records for {RECORD_NAME}", file=sink)
+    print(f"Expected: '{TOKEN}'", file=sink)
+
+
+def logger_request(logger: logging.Logger) -> None:
+    extra = {"domain": DOMAIN, "record_name": RECORD_NAME}
+    logger.info("Checking domain %s", DOMAIN)
+    logger.info("Looking for TXT record %s = %s", RECORD_NAME, TOKEN, extra=extra)
+    for _ in range(3):
+        logger.debug("Found TXT record %r", TOKEN[::-1], extra=extra)
+    logger.info("Token %r not found in TXT records for %s", TOKEN, RECORD_NAME, extra=extra)
+
+
+def run(request: Callable[[], Any]) -> list[float]:
+    per_thread = TOTAL_REQUESTS // THREADS
+    durations: list[float] = []
+    lock = threading.Lock()
+
+    def worker() -> None:
+        local: list[float] = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            request()
+            local.append(time.perf_counter() - start)
+        with lock:
+            durations.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations
+
+
+def report(label: str, durations: list[float], elapsed: float) -> None:
+    durations.sort()
+    p99 = durations[int(len(durations) * 0.99)]
+    print(f"{label:<28} mean {statistics.mean(durations) * 1e6:7.1f} us  p99 {p99 * 1e6:7.1f} us  total {elapsed:.2f}s")
+
+
+def bench_before(sink: IO[str]) -> None:
+    logger = logging.getLogger("bench.before")
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    start = time.perf_counter()
+    durations = run(lambda: print_request(sink, logger))
+    sink.flush()
+    report("print + sync logging", durations, time.perf_counter() - start)
+
+
+def bench_after(sink: IO[str]) -> None:
+    logger = logging.getLogger("bench.after")
+    handler = logging.StreamHandler(sink)
+    handler.setFormatter(JSONFormatter())
+    log_queue: queue.Queue[Any] = queue.Queue(TOTAL_REQUESTS * 10)
+    queue_handler = LazyQueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    start = time.perf_counter()
+    durations = run(lambda: logger_request(logger))
+    elapsed = time.perf_counter() - start
+    listener.stop()
+    sink.flush()
+    report("queue + lazy JSON logging", durations, elapsed)
+    print(f"{'':<28} drained in {time.perf_counter() - start:.2f}s, dropped {queue_handler.dropped}")
+
+
+def main() -> None:
+    read_delay = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.0
+    print(f"Requests: {TOTAL_REQUESTS:,} on {THREADS} threads, reader delay {read_delay * 1000:g}ms per 64KB")
+    with pipe_sink(read_delay) as sink:
+        bench_before(sink)
+    with pipe_sink(read_delay) as sink:
+        bench_after(sink)
+
+
+if __name__ == "__main__":
+    main()
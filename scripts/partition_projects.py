@@ -0,0 +1,74 @@
+"""
+Move projects to the partition layout configured by PROJECT_PARTITIONS
+and rebuild the project directory.
+
+Run from the project root with the new PROJECT_PARTITIONS value:
+    uv run python -m scripts.partition_projects
+"""
+
+import re
+
+from mongodb_odm import ReplaceOne, connect, disconnect
+from mongodb_odm.connection import db
+
+from app import config
+from app.models import Project, ProjectDirectory
+from app.partitions import project_partitioner
+
+
+def main() -> None:
+    connect(config.DB_URL)
+    database = db()
+
+    base_name = Project._get_collection_name()
+    collection_regex = re.compile(rf"^{base_name}(_\d+)?$")
+    target_names = {project_partitioner.collection_name(base_name, p) for p in project_partitioner.partitions()}
+
+    moved = 0
+    for source_name in database.list_collection_names():
+        if not collection_regex.match(source_name):
+            continue
+
+        source = database[source_name]
+        for data in source.find():
+            partition = project_partitioner.partition_for(data["subdomain"])
+            target_name = project_partitioner.collection_name(base_name, partition)
+            if target_name == source_name:
+                continue
+
+            database[target_name].replace_one({"_id": data["_id"]}, data, upsert=True)
+            source.delete_one({"_id": data["_id"]})
+            moved += 1
+
+        if source_name not in target_names and source.estimated_document_count() == 0:
+            source.drop()
+
+    for name in target_names:
+        database[name].create_indexes(Project.ODMConfig.indexes)
+
+    directory = database[ProjectDirectory._get_collection_name()]
+    directory.delete_many({})
+    if project_partitioner.is_partitioned:
+        directory.create_indexes(ProjectDirectory.ODMConfig.indexes)
+        for name in target_names:
+            requests = [
+                ReplaceOne(
+                    {"_id": data["_id"]},
+                    {
+                        "subdomain": data["subdomain"],
+                        "custom_domain": data.get("custom_domain"),
+                        "partition": project_partitioner.partition_for(data["subdomain"]),
+                    },
+                    upsert=True,
+                )
+                for data in database[name].find({}, {"subdomain": 1, "custom_domain": 1})
+            ]
+            if requests:
+                directory.bulk_write(requests)
+
+    print(f"Moved {moved} projects into {project_partitioner.count} partition(s)")
+    disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from app.cache import LRUCache
+from app.routers import domain_check
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_fill(self) -> None:
+        cache = LRUCache[bool](16, 60)
+        version = cache.version
+        cache.fill("a", True, version)
+        self.assertTrue(cache.get("a"))
+
+    def test_fill_after_a_write_is_ignored(self) -> None:
+        cache = LRUCache[bool](16, 60)
+        for write in [cache.clear, lambda: cache.invalidate("b"), lambda: cache.set("b", True)]:
+            with self.subTest(write=write):
+                version = cache.version
+                write()
+                cache.fill("a", True, version)
+                self.assertIsNone(cache.get("a"))
+
+    def test_disabled(self) -> None:
+        cache = LRUCache[bool](0, 60)
+        cache.set("a", True)
+        cache.fill("b", True, cache.version)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+
+class DomainCheckCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cache = LRUCache[bool](16, 60)
+        patch = mock.patch("app.routers.domain_cache", self.cache)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def check(self, domain: str) -> int:
+        return asyncio.run(domain_check(domain)).status_code
+
+    @mock.patch("app.routers.is_domain_allowed", return_value=True)
+    def test_allowed_host_is_cached(self, is_domain_allowed: mock.Mock) -> None:
+        self.assertEqual(self.check("Shop.org"), 200)
+        self.assertTrue(self.cache.get("shop.org"))
+
+        self.assertEqual(self.check("shop.org"), 200)
+        is_domain_allowed.assert_called_once()
+
+    def test_write_during_the_lookup_is_not_overwritten(self) -> None:
+        def allowed_then_removed(host: str) -> bool:
+            # The domain is removed on another thread right after it was read.
+            self.cache.clear()
+            return True
+
+        with mock.patch("app.routers.is_domain_allowed", allowed_then_removed):
+            self.assertEqual(self.check("shop.org"), 200)
+        self.assertIsNone(self.cache.get("shop.org"))
+
+    @mock.patch("app.routers.domain_checks_on_primary", False)
+    @mock.patch("app.routers.is_domain_allowed", return_value=True)
+    def test_secondary_reads_are_not_cached(self, is_domain_allowed: mock.Mock) -> None:
+        self.assertEqual(self.check("shop.org"), 200)
+        self.assertIsNone(self.cache.get("shop.org"))
+
+    @mock.patch("app.routers.is_domain_allowed", return_value=False)
+    def test_rejected_host_is_not_cached(self, is_domain_allowed: mock.Mock) -> None:
+        self.assertEqual(self.check("shop.org"), 403)
+        self.assertIsNone(self.cache.get("shop.org"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+from unittest import mock
+
+from fastapi import HTTPException
+
+from app.hosts import HostResolver
+from app.models import Project
+from app.schemas import CustomDomainAssignmentIn, CustomDomainResultOut
+from app.services import (
+    domain_regex,
+    get_sanitized_custom_domain,
+    set_custom_domains,
+    to_ascii_domain,
+    validate_domain_format,
+)
+
+host_resolver = HostResolver(["example.com"])
+
+
+class ToAsciiDomainTest(unittest.TestCase):
+    def test_ascii(self) -> None:
+        self.assertEqual(to_ascii_domain(" Shop.ORG. "), "shop.org")
+        self.assertEqual(to_ascii_domain("xn--bcher-kva.de"), "xn--bcher-kva.de")
+
+    def test_idna_2008(self) -> None:
+        self.assertEqual(to_ascii_domain("Bücher.DE."), "xn--bcher-kva.de")
+        # IDNA 2003, the codec of the standard library, maps it to "strasse.de".
+        self.assertEqual(to_ascii_domain("Straße.de"), "xn--strae-oqa.de")
+
+    def test_not_encodable(self) -> None:
+        self.assertIsNone(to_ascii_domain("☃.com"))
+        self.assertIsNone(to_ascii_domain("ü" * 64 + ".com"))
+
+
+class DomainRegexTest(unittest.TestCase):
+    def test_valid(self) -> None:
+        for domain in ["shop.org", "a.b.c.example.co.uk", "xn--bcher-kva.de", "ab--c.com", "1.io"]:
+            with self.subTest(domain=domain):
+                self.assertIsNotNone(domain_regex.match(domain))
+
+    def test_invalid(self) -> None:
+        for domain in ["shop", "a..b", ".shop.org", "-shop.org", "shop-.org", "sh op.org", "a" * 64 + ".com"]:
+            with self.subTest(domain=domain):
+                self.assertIsNone(domain_regex.match(domain))
+
+
+@mock.patch("app.services.host_resolver", host_resolver)
+class CustomDomainValidationTest(unittest.TestCase):
+    def test_sanitized(self) -> None:
+        self.assertEqual(get_sanitized_custom_domain("Bücher.DE."), "xn--bcher-kva.de")
+        self.assertIsNone(get_sanitized_custom_domain(None))
+        self.assertIsNone(get_sanitized_custom_domain(""))
+
+    def test_rejected(self) -> None:
+        for domain in ["shop", "a..b.org", "☃.com", "example.com", "shop.example.com", "a.b.example.com"]:
+            with self.subTest(domain=domain):
+                with self.assertRaises(HTTPException) as context:
+                    get_sanitized_custom_domain(domain)
+                self.assertEqual(context.exception.status_code, 400)
+                self.assertFalse(validate_domain_format(domain))
+
+    def test_base_domains_are_not_custom_domains(self) -> None:
+        with self.assertRaises(HTTPException) as context:
+            get_sanitized_custom_domain("shop.example.com")
+        self.assertIn("can't be used as a custom domain", context.exception.detail)
+
+    def test_validate_domain_format(self) -> None:
+        self.assertTrue(validate_domain_format("shop.org"))
+        self.assertTrue(validate_domain_format("notexample.com"))
+
+
+@contextmanager
+def no_session() -> Iterator[None]:
+    yield None
+
+
+@mock.patch("app.services.host_resolver", host_resolver)
+@mock.patch("app.services.write_session", no_session)
+class SetCustomDomainsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.projects = [Project(title=f"p{i}", subdomain=f"tenant{i}") for i in range(3)]
+        self.taken_domains: dict[str, str] = {}
+
+        patches = [
+            mock.patch.object(Project, "find", side_effect=self.find),
+            mock.patch("app.services.get_taken_custom_domains", side_effect=lambda domains: self.taken_domains),
+            mock.patch.object(Project, "bulk_write_projects"),
+            mock.patch("app.services.cache_projects"),
+        ]
+        self.find_mock, _, self.bulk_write, self.cache_projects = (patch.start() for patch in patches)
+        for patch in patches:
+            self.addCleanup(patch.stop)
+
+    def find(self, filter: dict[str, Any]) -> Iterator[Project]:
+        ids = filter["_id"]["$in"]
+        return (project for project in self.projects if project.id in ids)
+
+    def assign(self, *items: tuple[str, str]) -> list[CustomDomainResultOut]:
+        return set_custom_domains(
+            [CustomDomainAssignmentIn(project_id=project_id, custom_domain=domain) for project_id, domain in items]
+        )
+
+    def written(self) -> list[Project]:
+        if not self.bulk_write.called:
+            return []
+        return [project for project, _ in self.bulk_write.call_args.args[0]]
+
+    def test_assigns_domains(self) -> None:
+        first, second, _ = (str(project.id) for project in self.projects)
+        results = self.assign((first, "Shop.org"), (second, "Bücher.de"))
+
+        self.assertEqual([result.success for result in results], [True, True])
+        self.assertEqual([project.custom_domain for project in self.written()], ["shop.org", "xn--bcher-kva.de"])
+        self.assertTrue(all(project.domain_verification_token for project in self.written()))
+        self.assertIsNotNone(results[0].verification)
+        self.find_mock.assert_called_once()
+        self.cache_projects.assert_called_once()
+
+    def test_result_matrix(self) -> None:
+        first, second, third = (str(project.id) for project in self.projects)
+        self.taken_domains = {"taken.org": "0" * 24}
+
+        results = self.assign(
+            ("not-an-id", "a.org"),
+            ("f" * 24, "b.org"),
+            (first.upper(), "c.org"),
+            (first, "d.org"),
+            (second, "c.org"),
+            (second, "taken.org"),
+            (third, "shop.example.com"),
+            (third, "a..b"),
+        )
+
+        self.assertEqual(
+            [result.detail for result in results],
+            [
+                "Invalid project id",
+                "Project not found",
+                None,
+                "Project appears more than once",
+                "Custom domain 'c.org' is already taken.",
+                "Custom domain 'taken.org' is already taken.",
+                "Domain can't be used as a custom domain",
+                "Invalid custom domain format",
+            ],
+        )
+        # Results keep the id as it was sent.
+        self.assertEqual(results[2].project_id, first.upper())
+        self.assertEqual([project.id for project in self.written()], [self.projects[0].id])
+
+    def test_reassigning_the_own_domain(self) -> None:
+        first = str(self.projects[0].id)
+        self.taken_domains = {"shop.org": first}
+
+        results = self.assign((first, "shop.org"))
+        self.assertTrue(results[0].success)
+
+    def test_nothing_to_write(self) -> None:
+        results = self.assign(("not-an-id", "shop.org"))
+
+        self.assertFalse(results[0].success)
+        self.bulk_write.assert_not_called()
+        self.cache_projects.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
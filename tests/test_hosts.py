@@ -0,0 +1,123 @@
+import unittest
+from unittest import mock
+
+from starlette.requests import Request
+
+from app.hosts import HostKind, HostMatch, HostResolver, normalize_host
+from app.routers import get_custom_domain_from_request, get_subdomain_from_request
+
+BASE_DOMAINS = ["example.com", "eu.example.com", "example.co.uk"]
+
+
+class NormalizeHostTest(unittest.TestCase):
+    def test_lowercase_port_and_trailing_dot(self) -> None:
+        self.assertEqual(normalize_host("  ABC.Example.COM  "), "abc.example.com")
+        self.assertEqual(normalize_host("abc.example.com:8000"), "abc.example.com")
+        self.assertEqual(normalize_host("abc.example.com."), "abc.example.com")
+        self.assertEqual(normalize_host("abc.example.com.:443"), "abc.example.com")
+
+
+class HostResolverTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.resolver = HostResolver(BASE_DOMAINS, max_depth=1)
+
+    def test_subdomain(self) -> None:
+        self.assertEqual(
+            self.resolver.resolve("abc.example.com"),
+            HostMatch(HostKind.SUBDOMAIN, "abc.example.com", "abc", "example.com"),
+        )
+
+    def test_port_and_trailing_dot(self) -> None:
+        for host in ["ABC.example.com:8000", "abc.example.com.", "abc.example.com.:8000"]:
+            with self.subTest(host=host):
+                match = self.resolver.resolve(host)
+                self.assertEqual(match.kind, HostKind.SUBDOMAIN)
+                self.assertEqual(match.host, "abc.example.com")
+                self.assertEqual(match.subdomain, "abc")
+
+    def test_nested_base_domains_longest_wins(self) -> None:
+        self.assertEqual(
+            self.resolver.resolve("abc.eu.example.com"),
+            HostMatch(HostKind.SUBDOMAIN, "abc.eu.example.com", "abc", "eu.example.com"),
+        )
+        # "eu" is a tenant of example.com only if eu.example.com isn't a base domain.
+        self.assertEqual(
+            self.resolver.resolve("eu.example.com"),
+            HostMatch(HostKind.REJECT, "eu.example.com", None, "eu.example.com"),
+        )
+        self.assertEqual(HostResolver(["example.com"]).resolve("eu.example.com").subdomain, "eu")
+
+    def test_multi_label_base_domain(self) -> None:
+        match = self.resolver.resolve("shop.example.co.uk")
+        self.assertEqual(match.kind, HostKind.SUBDOMAIN)
+        self.assertEqual((match.subdomain, match.base_domain), ("shop", "example.co.uk"))
+
+    def test_depth(self) -> None:
+        self.assertEqual(
+            self.resolver.resolve("www.abc.example.com"),
+            HostMatch(HostKind.REJECT, "www.abc.example.com", None, "example.com"),
+        )
+
+        resolver = HostResolver(BASE_DOMAINS, max_depth=2)
+        self.assertEqual(resolver.resolve("www.abc.example.com").subdomain, "abc")
+        self.assertEqual(resolver.resolve("a.b.c.example.com").kind, HostKind.REJECT)
+
+    def test_max_depth_at_least_one(self) -> None:
+        self.assertEqual(HostResolver(BASE_DOMAINS, max_depth=0).resolve("abc.example.com").subdomain, "abc")
+
+    def test_base_domain_itself_is_rejected(self) -> None:
+        for host in ["example.com", "EXAMPLE.com.", "example.com:443"]:
+            with self.subTest(host=host):
+                self.assertEqual(
+                    self.resolver.resolve(host),
+                    HostMatch(HostKind.REJECT, "example.com", None, "example.com"),
+                )
+
+    def test_custom_domain(self) -> None:
+        for host in ["shop.org", "www.shop.org", "example.com.evil.org", "notexample.com"]:
+            with self.subTest(host=host):
+                self.assertEqual(self.resolver.resolve(host), HostMatch(HostKind.CUSTOM_DOMAIN, host))
+
+    def test_invalid_hosts_are_rejected(self) -> None:
+        for host in ["", ".", "localhost", "a..example.com", ".example.com", ":8000"]:
+            with self.subTest(host=host):
+                match = self.resolver.resolve(host)
+                self.assertEqual(match.kind, HostKind.REJECT)
+                self.assertIsNone(match.subdomain)
+
+    def test_base_domains_are_normalized(self) -> None:
+        resolver = HostResolver([" Example.COM. ", ""])
+        self.assertEqual(resolver.resolve("abc.example.com").base_domain, "example.com")
+
+
+def make_request(headers: dict[str, str]) -> Request:
+    raw_headers = [(name.lower().encode(), value.encode("latin-1")) for name, value in headers.items()]
+    return Request({"type": "http", "headers": raw_headers})
+
+
+@mock.patch("app.routers.host_resolver", HostResolver(BASE_DOMAINS, max_depth=1))
+class RequestScopeTest(unittest.TestCase):
+    def get_scope(self, headers: dict[str, str]) -> tuple[str | None, str | None]:
+        request = make_request(headers)
+        return get_subdomain_from_request(request), get_custom_domain_from_request(request)
+
+    def test_subdomain_host(self) -> None:
+        self.assertEqual(self.get_scope({"X-Custom-Domain": "ABC.example.com:443"}), ("abc", None))
+
+    def test_custom_domain_host(self) -> None:
+        self.assertEqual(self.get_scope({"X-Custom-Domain": "Shop.org."}), (None, "shop.org"))
+
+    def test_rejected_host_keeps_a_scope(self) -> None:
+        for host in ["example.com", "localhost", "www.abc.example.com", ".", ":80"]:
+            with self.subTest(host=host):
+                subdomain, custom_domain = self.get_scope({"X-Custom-Domain": host})
+                self.assertIsNone(subdomain)
+                self.assertTrue(custom_domain)
+
+    def test_subdomain_header(self) -> None:
+        self.assertEqual(self.get_scope({"X-Subdomain": "ABC"}), ("abc", None))
+        self.assertEqual(self.get_scope({}), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+from app.hotkeys import SpaceSaving
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_counts(self) -> None:
+        tracker = SpaceSaving(3)
+        for key in ["a", "b", "a", "c", "a", "b"]:
+            tracker.add(key)
+
+        self.assertEqual(tracker.top(2), [("a", 3), ("b", 2)])
+
+    def test_new_key_replaces_least_counted(self) -> None:
+        tracker = SpaceSaving(2)
+        for key in ["a", "a", "b", "c"]:
+            tracker.add(key)
+
+        # "c" evicts "b" and inherits its count.
+        self.assertEqual(tracker.counts, {"a": 2, "c": 2})
+
+        tracker.add("d")
+        self.assertEqual(len(tracker.counts), 2)
+        self.assertEqual(tracker.top(1), [("d", 3)])
+
+    def test_eviction_follows_the_minimum(self) -> None:
+        tracker = SpaceSaving(3)
+        for key in ["a", "a", "a", "b", "b", "c"]:
+            tracker.add(key)
+
+        for key in ["d", "e", "f"]:
+            tracker.add(key)
+            self.assertIn("a", tracker.counts)
+            self.assertIn(key, tracker.counts)
+
+        self.assertEqual(tracker.counts["a"], 3)
+
+    def test_decay(self) -> None:
+        tracker = SpaceSaving(3)
+        for key in ["a", "a", "a", "a", "b", "b", "c"]:
+            tracker.add(key)
+
+        tracker.decay()
+        self.assertEqual(tracker.counts, {"a": 2, "b": 1})
+
+        # The freed slot is used before evicting anything.
+        tracker.add("d")
+        tracker.add("e")
+        self.assertEqual(tracker.counts, {"a": 2, "d": 1, "e": 2})
+
+    def test_disabled(self) -> None:
+        tracker = SpaceSaving(0)
+        tracker.add("a")
+        self.assertEqual(tracker.top(10), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
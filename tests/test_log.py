@@ -0,0 +1,67 @@
+import logging
+import queue
+import threading
+import unittest
+from typing import Any
+
+from app.log import LazyQueueHandler, LogListener
+
+
+class BlockingHandler(logging.Handler):
+    """Collect the records, the first one waits until released"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+        self.started = threading.Event()
+        self.unblocked = threading.Event()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.started.set()
+        self.unblocked.wait(5)
+        self.records.append(record)
+
+
+class LogListenerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        log_queue: queue.Queue[Any] = queue.Queue(2)
+        self.queue_handler = LazyQueueHandler(log_queue)
+        self.handler = BlockingHandler()
+        self.listener = LogListener(self.queue_handler, self.handler)
+
+        self.logger = logging.getLogger("tests.log")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.queue_handler)
+        self.addCleanup(self.logger.removeHandler, self.queue_handler)
+
+    def test_full_queue_at_shutdown(self) -> None:
+        self.listener.start()
+        self.logger.info("first")
+        self.assertTrue(self.handler.started.wait(5))
+
+        # The listener is busy with the first record, the queue fills up and the rest is dropped.
+        for i in range(5):
+            self.logger.info("record %s", i)
+        self.assertTrue(self.queue_handler.queue.full())
+        self.assertEqual(self.queue_handler.dropped, 3)
+
+        threading.Timer(0.1, self.handler.unblocked.set).start()
+        self.listener.stop()
+
+        messages = [record.getMessage() for record in self.handler.records]
+        self.assertEqual(messages[:3], ["first", "record 0", "record 1"])
+        self.assertIn("Dropped 3 log records", messages[-1])
+        self.assertEqual(self.handler.records[-1].levelno, logging.WARNING)
+
+    def test_no_report_without_drops(self) -> None:
+        self.handler.unblocked.set()
+        self.listener.start()
+        self.logger.info("first")
+        self.listener.stop()
+
+        self.assertEqual([record.getMessage() for record in self.handler.records], ["first"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+from unittest import mock
+
+from mongodb_odm import connect, disconnect
+from pymongo.errors import PyMongoError
+
+from app.models import Project, ProjectDirectory
+from app.partitions import HashedPartitioner, use_partition
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+PARTITIONS = 3
+
+
+def subdomain_in(partitioner: HashedPartitioner, partition: int, skip: int = 0) -> str:
+    """A subdomain hashed to the partition"""
+    subdomains = (f"tenant{i}" for i in range(1000))
+    matches = (subdomain for subdomain in subdomains if partitioner.partition_for(subdomain) == partition)
+    for _ in range(skip):
+        next(matches)
+    return next(matches)
+
+
+class HashedPartitionerTest(unittest.TestCase):
+    def test_single_partition_keeps_the_collection(self) -> None:
+        for count in [0, 1]:
+            partitioner = HashedPartitioner(count)
+            self.assertFalse(partitioner.is_partitioned)
+            self.assertEqual(partitioner.partitions(), [0])
+            self.assertEqual(partitioner.collection_name("project", 0), "project")
+
+    def test_partitions(self) -> None:
+        partitioner = HashedPartitioner(PARTITIONS)
+        self.assertTrue(partitioner.is_partitioned)
+        self.assertEqual(partitioner.partitions(), [0, 1, 2])
+        self.assertEqual(partitioner.collection_name("project", 2), "project_2")
+
+    def test_partition_is_stable(self) -> None:
+        partitioner = HashedPartitioner(PARTITIONS)
+        # crc32("abc") == 891568578, the value must not change between processes or releases.
+        self.assertEqual(partitioner.partition_for("abc"), 891568578 % PARTITIONS)
+        self.assertEqual({partitioner.partition_for(f"tenant{i}") for i in range(50)}, {0, 1, 2})
+
+
+@unittest.skipIf(mongomock is None, "mongomock is not installed")
+class PartitionedProjectTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.partitioner = HashedPartitioner(PARTITIONS)
+        patches = [
+            mock.patch("mongodb_odm.connection._get_connection_client", lambda url: mongomock.MongoClient(url)),
+            mock.patch("app.models.project_partitioner", self.partitioner),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        connect("mongodb://localhost/test")
+        self.addCleanup(disconnect)
+
+    def create_project(self, partition: int, skip: int = 0, **kwargs: Any) -> Project:
+        subdomain = subdomain_in(self.partitioner, partition, skip)
+        return Project(title=subdomain, subdomain=subdomain, **kwargs).create()
+
+    def stored_in(self, project: Project) -> list[int]:
+        partitions = []
+        for partition in self.partitioner.partitions():
+            with use_partition(partition):
+                if Project._get_collection().find_one({"_id": project.id}):
+                    partitions.append(partition)
+        return partitions
+
+    def directory_partition(self, project: Project) -> int | None:
+        entry = ProjectDirectory.find_one({"_id": project.id})
+        return entry.partition if entry else None
+
+    @contextmanager
+    def failing(self, method: str, partition: int) -> Iterator[None]:
+        """Make a collection method fail on a single project partition"""
+        collection_name = self.partitioner.collection_name("project", partition)
+        original = getattr(mongomock.collection.Collection, method)
+
+        def fail(collection: Any, *args: Any, **kwargs: Any) -> Any:
+            if collection.name == collection_name:
+                raise PyMongoError("failed")
+            return original(collection, *args, **kwargs)
+
+        with mock.patch.object(mongomock.collection.Collection, method, fail):
+            yield
+
+    def test_create_writes_the_directory(self) -> None:
+        project = self.create_project(1, custom_domain="shop.org")
+
+        self.assertEqual(self.stored_in(project), [1])
+        entry = ProjectDirectory.find_one({"_id": project.id})
+        self.assertEqual((entry.subdomain, entry.custom_domain, entry.partition), (project.subdomain, "shop.org", 1))
+
+    def test_get_partitions(self) -> None:
+        project = self.create_project(2, custom_domain="shop.org")
+
+        self.assertEqual(Project.get_partitions({"subdomain": project.subdomain}), [2])
+        self.assertEqual(Project.get_partitions({"subdomain": "missing"}), [self.partitioner.partition_for("missing")])
+        self.assertEqual(Project.get_partitions({"_id": project.id}), [2])
+        self.assertEqual(Project.get_partitions({"custom_domain": "shop.org"}), [2])
+        self.assertEqual(Project.get_partitions({"custom_domain": "other.org"}), [])
+        self.assertEqual(Project.get_partitions({"subdomain": {"$in": ["a", "b"]}}), [0, 1, 2])
+        self.assertEqual(Project.get_partitions({"title": "a"}), [0, 1, 2])
+
+    def test_get_partitions_unpartitioned(self) -> None:
+        with mock.patch("app.models.project_partitioner", HashedPartitioner(1)):
+            self.assertEqual(Project.get_partitions({"subdomain": "abc"}), [0])
+
+    def test_find_across_partitions(self) -> None:
+        projects = [self.create_project(partition) for partition in [0, 1, 2, 2]]
+
+        self.assertEqual({p.id for p in Project.find()}, {p.id for p in projects})
+        self.assertEqual(len(list(Project.find({}, limit=3))), 3)
+        self.assertEqual(Project.find_one({"_id": projects[3].id}).subdomain, projects[3].subdomain)
+        self.assertEqual(Project.count_documents({}), 4)
+        self.assertTrue(Project.exists({"subdomain": projects[1].subdomain}))
+
+        with self.assertRaises(ValueError):
+            list(Project.find({}, sort=[("title", 1)]))
+
+    def test_find_raw_is_single_partition(self) -> None:
+        project = self.create_project(1)
+
+        self.assertEqual(list(Project.find_raw({"_id": project.id}))[0]["subdomain"], project.subdomain)
+        self.assertEqual(list(Project.find_raw({"custom_domain": "other.org"})), [])
+        with self.assertRaises(ValueError):
+            Project.find_raw({"title": project.title})
+
+    def test_unrouted_collection_access_fails(self) -> None:
+        with self.assertRaises(RuntimeError):
+            Project._get_collection()
+
+    def test_update_one_rejects_directory_changes(self) -> None:
+        project = self.create_project(0)
+
+        with self.assertRaises(ValueError):
+            Project.update_one({"_id": project.id}, {"$set": {"subdomain": "abc"}})
+        with self.assertRaises(ValueError):
+            project.update({"$set": {"custom_domain": "shop.org"}})
+
+        result = Project.update_one({"_id": project.id}, {"$set": {"title": "renamed"}})
+        self.assertEqual(result.matched_count, 1)
+        self.assertEqual(Project.find_one({"_id": project.id}).title, "renamed")
+
+    def test_update_custom_domain(self) -> None:
+        project = self.create_project(1)
+        project.custom_domain = "shop.org"
+
+        self.assertEqual(project.update().matched_count, 1)
+        self.assertEqual(Project.find_one({"custom_domain": "shop.org"}).id, project.id)
+
+    def test_failed_create_restores_the_directory(self) -> None:
+        subdomain = subdomain_in(self.partitioner, 2)
+        project = Project(title=subdomain, subdomain=subdomain)
+
+        with self.failing("insert_one", 2), self.assertRaises(PyMongoError):
+            project.create()
+
+        self.assertIsNone(ProjectDirectory.find_one({"_id": project.id}))
+
+    def test_failed_update_restores_the_directory(self) -> None:
+        project = self.create_project(1)
+        project.custom_domain = "shop.org"
+
+        with self.failing("update_one", 1), self.assertRaises(PyMongoError):
+            project.update()
+
+        self.assertIsNone(ProjectDirectory.find_one({"_id": project.id}).custom_domain)
+
+    def test_subdomain_change_moves_the_project(self) -> None:
+        project = self.create_project(0, custom_domain="shop.org")
+        project.subdomain = subdomain_in(self.partitioner, 2)
+
+        self.assertEqual(project.update().matched_count, 1)
+
+        self.assertEqual(self.stored_in(project), [2])
+        self.assertEqual(self.directory_partition(project), 2)
+        self.assertEqual(Project.find_one({"_id": project.id}).subdomain, project.subdomain)
+        self.assertEqual(Project.find_one({"subdomain": project.subdomain}).id, project.id)
+        self.assertEqual(Project.find_one({"custom_domain": "shop.org"}).id, project.id)
+
+    def test_subdomain_change_within_the_partition(self) -> None:
+        project = self.create_project(1)
+        project.subdomain = subdomain_in(self.partitioner, 1, skip=1)
+
+        self.assertEqual(project.update().matched_count, 1)
+        self.assertEqual(self.stored_in(project), [1])
+        self.assertEqual(ProjectDirectory.find_one({"_id": project.id}).subdomain, project.subdomain)
+
+    def test_failed_move_keeps_the_project(self) -> None:
+        project = self.create_project(0)
+        subdomain = project.subdomain
+        project.subdomain = subdomain_in(self.partitioner, 2)
+
+        with self.failing("delete_one", 0), self.assertRaises(PyMongoError):
+            project.update()
+
+        self.assertEqual(self.stored_in(project), [0])
+        self.assertEqual(self.directory_partition(project), 0)
+        self.assertEqual(Project.find_one({"_id": project.id}).subdomain, subdomain)
+
+    def test_move_rejects_raw_updates(self) -> None:
+        project = self.create_project(0)
+        project.subdomain = subdomain_in(self.partitioner, 1)
+
+        with self.assertRaises(ValueError):
+            project.update({"$set": {"title": "renamed"}})
+        self.assertEqual(self.stored_in(project), [0])
+
+    def test_delete_removes_the_directory_entry(self) -> None:
+        project = self.create_project(2)
+        project.delete()
+
+        self.assertEqual(self.stored_in(project), [])
+        self.assertIsNone(ProjectDirectory.find_one({"_id": project.id}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from unittest import mock
+
+from app.profiling import is_profiling_secret
+
+
+class ProfilingSecretTest(unittest.TestCase):
+    @mock.patch("app.profiling.PROFILING_SECRET", "s3cret")
+    def test_secret(self) -> None:
+        self.assertTrue(is_profiling_secret("s3cret"))
+        self.assertFalse(is_profiling_secret("other"))
+        self.assertFalse(is_profiling_secret(""))
+        self.assertFalse(is_profiling_secret(None))
+
+    @mock.patch("app.profiling.PROFILING_SECRET", "s3cret")
+    def test_non_ascii_header(self) -> None:
+        self.assertFalse(is_profiling_secret("café"))
+
+    @mock.patch("app.profiling.PROFILING_SECRET", "café")
+    def test_non_ascii_secret(self) -> None:
+        # Starlette decodes the UTF-8 bytes sent by the client as latin-1.
+        self.assertTrue(is_profiling_secret("café".encode().decode("latin-1")))
+
+    @mock.patch("app.profiling.PROFILING_SECRET", None)
+    def test_disabled(self) -> None:
+        self.assertFalse(is_profiling_secret("s3cret"))
+
+
+if __name__ == "__main__":
+    unittest.main()